@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Glass selection for thin achromatic doublets and apochromatic triplets.
+
+Each glass i is described over the spectral band by its normalized dispersion
+
+    K_i(L) = (n_i(L) - 1)/(n_i(Lc) - 1)
+
+so a thin element of power phi_i at the center wavelength Lc has power
+phi_i*K_i(L) at L, and a group of thin lenses in contact has power
+sum(phi_i*K_i(L)).  The power split is solved for every glass combination at
+once:
+
+    doublet  : sum(phi) = Phi, and equal power at the band ends (achromat)
+    triplet  : sum(phi) = Phi, and equal power at both band ends and Lc
+               (apochromat)
+
+The residual focus spread (secondary/tertiary spectrum) is then the range of
+1/sum(phi_i*K_i(L)) over a wavelength grid across the band, evaluated from the
+Sellmeier data.  Combinations are ranked by focus spread among those whose
+total element power sum(|phi_i|)/|Phi| is below max_power.  Negative
+(diverging) focal lengths are searched the same way.
+
+Triplets use branch and bound: for the first two glasses, the power of the
+third glass depends only on the pair, and the total power grows as the third
+glass approaches the line through the pair on the (partial dispersion) map of
+(K(Ls) - 1, K(Ll) - 1).  Pairs that cannot reach max_power with any glass are
+pruned before the third glass is enumerated, and third glasses too close to
+the pair's line are pruned before the spectrum is evaluated.
+
+"""
+
+import numpy as np
+
+from glass_catalog import LINES, default_catalog
+
+
+def band_wavelengths(band=('F', 'd', 'C')):
+    """(short, center, long) wavelengths in microns from line names (see
+    glass_catalog.LINES) or numbers."""
+
+    return tuple(LINES[b] if isinstance(b, str) else float(b) for b in band)
+
+
+def normalized_dispersion(catalog, band=('F', 'd', 'C'), num=21):
+    """Normalized dispersion K of every glass over the band.
+
+    Returns
+    -------
+    K : ndarray
+        K(L) on a uniform grid of num wavelengths across the band,
+        shape (glasses, num)
+    ends : ndarray
+        K at the short and long ends of the band, shape (glasses, 2)
+    """
+
+    short, center, long = band_wavelengths(band)
+    wl = np.linspace(short, long, num)
+    n = catalog.index(np.r_[center, short, long, wl]) - 1
+    K = n[:,1:]/n[:,:1]
+
+    return K[:,2:], K[:,:2]
+
+
+def _result(catalog, rows, phi, spread, f):
+    glasses = rows.shape[1]
+    dtype = ([('glass{}'.format(i+1), 'U16') for i in range(glasses)]
+             + [('phi{}'.format(i+1), float) for i in range(glasses)]
+             + [('power_sum', float), ('spread', float)])
+    out = np.empty(rows.shape[0], dtype=dtype)
+    names = np.array(catalog.names)
+    for i in range(glasses):
+        out['glass{}'.format(i+1)] = names[rows[:,i]]
+        out['phi{}'.format(i+1)] = phi[:,i]
+    out['power_sum'] = np.abs(phi).sum(axis=1)*abs(f)
+    out['spread'] = spread
+
+    return out
+
+
+def _spread(phi, K):
+    """Range of the focal length over the band, phi (combos, glasses) and K
+    (combos, glasses, wavelengths)."""
+
+    efl = 1/np.einsum('cg,cgw->cw', phi, K)
+    return efl.max(axis=1) - efl.min(axis=1)
+
+
+def _top(spread, top):
+    best = np.arange(spread.size)
+    if top < spread.size:
+        best = np.argpartition(spread, top)[:top]
+    return best[np.argsort(spread[best], kind='stable')]
+
+
+def search_doublets(focal_length, band=('F', 'd', 'C'), catalog=None,
+                    top=20, max_power=6.0, num=21):
+    """Rank thin achromatic doublets over every glass pair of a catalog.
+
+    Parameters
+    ----------
+    focal_length : float
+        Target focal length at the center wavelength
+    band : tuple (optional)
+        (short, center, long) line names or wavelengths in microns.  Default
+        is the visible F, d, C
+    catalog : GlassCatalog (optional)
+        Glasses to search.  Default is the merged vendor catalog
+    top : int (optional)
+        Number of doublets returned.  Default is 20
+    max_power : float (optional)
+        Largest allowed sum(|phi_i|)/|Phi|.  Default is 6
+    num : int (optional)
+        Wavelength samples across the band.  Default is 21
+
+    Returns
+    -------
+    doublets : structured ndarray
+        Fields glass1, glass2, phi1, phi2 (element powers), power_sum
+        (sum(|phi_i|)/|Phi|) and spread (focal length range across the band),
+        smallest spread first
+    """
+
+    catalog = default_catalog() if catalog is None else catalog
+    K, ends = normalized_dispersion(catalog, band, num)
+    inv_V = ends[:,0] - ends[:,1]           #1/V generalized to the band
+    Phi = 1/focal_length
+
+    i, j = np.triu_indices(len(catalog), 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        phi1 = Phi*inv_V[j]/(inv_V[j] - inv_V[i])
+    phi2 = Phi - phi1
+    limit = max_power*abs(Phi)
+    keep = np.isfinite(phi1) & ((np.abs(phi1) + np.abs(phi2)) <= limit)
+    i, j = i[keep], j[keep]
+    phi = np.column_stack([phi1[keep], phi2[keep]])
+
+    spread = _spread(phi, np.stack([K[i], K[j]], axis=1))
+    best = _top(spread, top)
+    rows = np.column_stack([i, j])[best]
+
+    return _result(catalog, rows, phi[best], spread[best], focal_length)
+
+
+def search_triplets(focal_length, band=('F', 'd', 'C'), catalog=None,
+                    top=20, max_power=6.0, num=21, chunk_size=1000000):
+    """Rank thin apochromatic triplets (three glasses in contact) with branch
+    and bound over glass triples.
+
+    Parameters are as for search_doublets, plus
+
+    chunk_size : int (optional)
+        Maximum number of candidate triplets whose spectrum is evaluated at
+        once.  Default is 1000000
+
+    Returns
+    -------
+    triplets : structured ndarray
+        Fields glass1..glass3, phi1..phi3, power_sum and spread
+    """
+
+    catalog = default_catalog() if catalog is None else catalog
+    K, ends = normalized_dispersion(catalog, band, num)
+    p = ends - 1                            #glass points (a, b), K(Lc) = 1
+    Phi = 1/focal_length
+    G = len(catalog)
+
+    #solve [1 1 1; a; b] phi = [Phi, 0, 0] by Cramer's rule:
+    #phi_k = Phi*(a_i*b_j - a_j*b_i)/D with D = cross(p_j - p_i, p_k - p_i)
+    i, j = np.triu_indices(G, 1)
+    edge = p[j] - p[i]
+    cross_ij = p[i,0]*p[j,1] - p[j,0]*p[i,1]
+
+    #bound: |D| <= |edge|*(largest distance of any glass from the pair),
+    #so |phi_k| >= |Phi|*|cross_ij|/(|edge|*diameter) prunes whole pairs
+    diameter = np.hypot(*(p.max(axis=0) - p.min(axis=0)))
+    length = np.hypot(edge[:,0], edge[:,1])
+    keep = np.abs(cross_ij) < max_power*length*diameter
+    i, j, edge, cross_ij = i[keep], j[keep], edge[keep], cross_ij[keep]
+
+    rows, phis, spreads = [], [], []
+    pairs_per_chunk = max(1, chunk_size//G)
+    for start in range(0, i.size, pairs_per_chunk):
+        s = slice(start, start + pairs_per_chunk)
+        pi, pj, e, c = i[s], j[s], edge[s], cross_ij[s]
+
+        #branch on the third glass k > j
+        k = np.arange(G)
+        d = p[k][None] - p[pi][:,None]
+        D = e[:,None,0]*d[...,1] - e[:,None,1]*d[...,0]
+        valid = ((k[None] > pj[:,None])
+                 & (np.abs(D) > np.abs(c)[:,None]/max_power))
+        a, b = np.nonzero(valid)
+        ti, tj, tk, D = pi[a], pj[a], k[b], D[a,b]
+
+        #the other two powers by Cramer's rule
+        phi3 = Phi*c[a]/D
+        phi1 = Phi*(p[tj,0]*p[tk,1] - p[tk,0]*p[tj,1])/D
+        phi2 = Phi - phi1 - phi3
+        phi = np.column_stack([phi1, phi2, phi3])
+        ok = np.abs(phi).sum(axis=1) <= max_power*abs(Phi)
+        t = np.column_stack([ti, tj, tk])[ok]
+        phi = phi[ok]
+        if not t.size:
+            continue
+
+        spread = _spread(phi, K[t])
+        best = _top(spread, top)
+        rows.append(t[best])
+        phis.append(phi[best])
+        spreads.append(spread[best])
+
+    if not rows:
+        return _result(catalog, np.empty((0, 3), dtype=int), np.empty((0, 3)),
+                       np.empty(0), focal_length)
+
+    rows, phi, spread = (np.concatenate(rows), np.concatenate(phis),
+                         np.concatenate(spreads))
+    best = _top(spread, top)
+
+    return _result(catalog, rows[best], phi[best], spread[best], focal_length)
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Startup benchmark: import time of the compute-only modules.
+
+Each module is imported in a fresh interpreter (python -X importtime), so the
+numbers include everything the import pulls in.  Also reports whether the
+import loaded matplotlib, seaborn or scipy, which the numeric core should
+never need.
+
+Run from the repository root:
+
+    python benchmarks/import_time.py
+
+"""
+
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ['optical_calcs', 'first_order_optics', 'matrix_optics', 'zernike',
+           'glass_catalog', 'ray_sampling', 'real_ray_trace', 'gaussian_beam',
+           'parameter_sweep']
+
+HEAVY = ('matplotlib', 'seaborn', 'scipy', 'pandas')
+
+
+def import_time(module, repeat=5):
+    """Best of repeat cold import times (seconds) for module, and the heavy
+    packages it loaded."""
+
+    best = None
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                               'import ' + module], cwd=ROOT,
+                              capture_output=True, text=True, check=True)
+        loaded = set()
+        total = 0
+        for line in proc.stderr.splitlines():
+            #import time: self [us] | cumulative | imported package
+            parts = line.split('|')
+            if len(parts) != 3 or not parts[1].strip().isdigit():
+                continue
+            name = parts[2].strip()
+            loaded.add(name.split('.')[0])
+            if name == module:
+                total = int(parts[1])
+        best = total if best is None else min(best, total)
+
+    return best*1e-6, sorted(loaded.intersection(HEAVY))
+
+
+if __name__ == '__main__':
+    print('{:<22}{:>12}   {}'.format('module', 'import (ms)', 'heavy deps'))
+    for module in MODULES:
+        t, heavy = import_time(module)
+        print('{:<22}{:>12.1f}   {}'.format(module, 1e3*t,
+                                          ', '.join(heavy) or '-'))
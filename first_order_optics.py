@@ -2,11 +2,18 @@
 """
 Geometrical imaging equations, Paraxial optical calculations
 
+Like optical_calcs, every function broadcasts over array inputs, takes an 
+optional out= array, and functions that can blow up (ex: afocal systems) 
+accept mask=True to also return a boolean array of the valid elements.  
+Invalid elements of thin_lens_image_dist, two_lens_EFL and thick_lens_EFL
+hold +/-inf (an image or focus at infinity), not NaN.
+
 """
 
 
 import numpy as np
-import scipy.constants as const
+
+from ufunc_utils import out_array, ufunc_result
 
 
 # Need to clarify some of these functions
@@ -14,27 +21,34 @@ import scipy.constants as const
 #newtons were derived in 1666 using similar triangles, referenced to focal planes.
 
     
-def obj_dist_from_EFL_and_m(f,m):
+def obj_dist_from_EFL_and_m(f,m, out=None):
     """Calculate object distance (z) from focal length (f) and magnification (m)
     """
     
-    obj_dist = -1*((1-m)/m)*f
-    return obj_dist
+    given = out is not None
+    obj_dist = out_array(out, f, m)
+    np.subtract(m, 1, out=obj_dist)
+    obj_dist /= m
+    obj_dist *= f
+    return ufunc_result(obj_dist, given)
     # todo: clarify assumptions in terms of +/- distances.
     
     
 
-def img_dist_from_EFL_and_m(f,m):
+def img_dist_from_EFL_and_m(f,m, out=None):
     """Calculate image distance (z') from focal length (f) and magnification (m)
     """
     
-    img_dist = (1-m)*f
-    return img_dist   
+    given = out is not None
+    img_dist = out_array(out, f, m)
+    np.subtract(1, m, out=img_dist)
+    img_dist *= f
+    return ufunc_result(img_dist, given)
     # todo: clarify assumptions in terms of +/- distances.
     
     
     
-def thin_lens_image_dist(obj_dist,efl):
+def thin_lens_image_dist(obj_dist,efl, out=None, mask=False):
     """Calculate the image distance given the object distance and efl.  Uses
     the thin lens equation 1/img + 1/obj = 1/f.  Returns same units.
     
@@ -44,6 +58,11 @@ def thin_lens_image_dist(obj_dist,efl):
         Distance to object
     efl : float
         Focal length of the thin lens
+    out : ndarray (optional)
+        Array to store the result in
+    mask : bool (optional)
+        Also return a boolean array, False where the image is at infinity
+        (object at the focal point; img_dist is +/-inf)
         
     Returns
     -------
@@ -51,15 +70,19 @@ def thin_lens_image_dist(obj_dist,efl):
         The image distance
     """  
     
-    efl = float(efl)
-    obj_dist = float(obj_dist)      #convert to float if int
-    img_dist = 1/(1/efl - 1/obj_dist)
-    return img_dist
-    #todo: catch infinite case
+    given = out is not None
+    img_dist = out_array(out, obj_dist, efl)
+    with np.errstate(divide='ignore'):
+        np.reciprocal(np.asarray(obj_dist, dtype=float), out=img_dist)
+        np.subtract(np.reciprocal(np.asarray(efl, dtype=float)), img_dist, 
+                    out=img_dist)
+        valid = img_dist != 0
+        np.reciprocal(img_dist, out=img_dist)
+    return ufunc_result(img_dist, given, valid, mask)
     #todo: clarify parameters.  This is the distance in front of the focal pt.
 
     
-def two_lens_EFL(f1,f2,d):
+def two_lens_EFL(f1,f2,d, out=None, mask=False):
     """Calculate the focal length of two thin lenses sepatated by air.  The 
     units must match, and will return the same units.
     
@@ -71,6 +94,10 @@ def two_lens_EFL(f1,f2,d):
         Focal length of lens 2
     d : float
         Separation distance between the two lenses
+    out : ndarray (optional)
+        Array to store the result in
+    mask : bool (optional)
+        Also return a boolean array, False for afocal systems (f is +/-inf)
         
     Returns
     -------
@@ -78,13 +105,20 @@ def two_lens_EFL(f1,f2,d):
         The focal length of the two lens system
     """    
     
-    phi1 = 1.0/f1
-    phi2 = 1.0/f2
-    phi = phi1 + phi2 -phi1*phi2*d
+    #power form, so a zero power (infinite focal length) lens works
+    given = out is not None
+    f = out_array(out, f1, f2, d)
+    phi1 = np.divide(1.0, f1)
+    phi2 = np.divide(1.0, f2)
+    np.add(phi1, phi2, out=f)
+    f -= phi1*phi2*d
+    valid = f != 0
+    with np.errstate(divide='ignore'):
+        np.divide(1.0, f, out=f)
 
-    return 1.0/phi
+    return ufunc_result(f, given, valid, mask)
     
-def thick_lens_EFL(R1,R2,t,n):
+def thick_lens_EFL(R1,R2,t,n, out=None, mask=False):
     """Calculate the focal length of a thick lens via geometrical method, 
     given the two surface radii, the center thickenss, and the index.  
     The units must match, and will return the same units.   
@@ -99,23 +133,37 @@ def thick_lens_EFL(R1,R2,t,n):
         Center thickenss of the lens
     n : float
         Index of refraction
+    out : ndarray (optional)
+        Array to store the result in
+    mask : bool (optional)
+        Also return a boolean array, False for zero power (f is +/-inf)
         
     Returns
     -------
     f : float
         The focal length of the thick lens
     """  
+    n = np.asarray(n, dtype=float)
     tau = t/n
-    C1 = 1.0/R1
-    C2 = 1.0/R2
-    phi = (n-1.0)*(C1-C2 + (n-1)*C1*C2*tau)
-    efl = 1.0/phi    
-    
-    return efl
+    C1 = 1.0/np.asarray(R1, dtype=float)
+    C2 = 1.0/np.asarray(R2, dtype=float)
+    
+    given = out is not None
+    efl = out_array(out, R1, R2, t, n)
+    np.multiply(C1*C2, tau, out=efl)
+    efl *= n-1
+    efl += C1
+    efl -= C2
+    efl *= n-1.0     #phi
+    valid = efl != 0
+    with np.errstate(divide='ignore'):
+        np.reciprocal(efl, out=efl)
+    
+    return ufunc_result(efl, given, valid, mask)
     #test1 50,-50,10,1.5 matches Zemax exactly: 51.741
     #todo:  better way to convert units besides writing several if's
 
-def thin_prism_deviation(angle, n):
+def thin_prism_deviation(angle, n, out=None):
     """Calculate the ray deviation caused by a thin prism given prism angle
         and index.
     
@@ -126,10 +174,16 @@ def thin_prism_deviation(angle, n):
     n: float
         Index of refraction of the prism material at the wavelength of interest
         
+    out : ndarray (optional)
+        Array to store the result in
+        
     Returns
     -------
     d : float
         The ray deviation due to the prism (in units of input angle)
     """  
-    d = -1*(n-1)*angle
-    return d
+    given = out is not None
+    d = out_array(out, angle, n)
+    np.subtract(1, n, out=d)
+    d *= angle
+    return ufunc_result(d, given)
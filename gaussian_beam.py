@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Gaussian beam propagation with the complex beam parameter (q).
+
+The same ABCD matricies used for rays in matrix_optics transform the beam
+parameter through q' = (Aq + B)/(Cq + D), where 1/q = 1/R - i*lambda/(pi*w**2).
+All functions broadcast over arrays of beams, so many wavelengths and waist
+sizes are propagated together in one call.
+
+Units must be consistent: waist radius, wavelength and matrix distances all in
+the same length unit (ex: mm).  The matricies use reduced distances (d/n), so
+the wavelength is the vacuum wavelength and the returned radius of curvature
+is R/n (R itself in air).
+
+"""
+
+import numpy as np
+
+
+def q_from_waist(w0, wavelength, z=0.0):
+    """Complex beam parameter at a distance z past a waist of radius w0.
+
+    Parameters
+    ----------
+    w0 : float or ndarray
+        Waist radius (1/e^2 intensity)
+    wavelength : float or ndarray
+        Wavelength, same units as w0
+    z : float or ndarray (optional)
+        Distance from the waist.  Default is 0 (at the waist)
+
+    Returns
+    -------
+    q : complex ndarray
+        The beam parameter, broadcast over the inputs
+    """
+
+    zr = np.pi*np.asarray(w0, dtype=float)**2/wavelength  #Rayleigh range
+    return z + 1j*zr
+
+
+def beam_radius(q, wavelength):
+    """1/e^2 beam radius for beam parameter q."""
+
+    return np.sqrt(-wavelength/(np.pi*np.imag(1/q)))
+
+
+def radius_of_curvature(q):
+    """Wavefront radius of curvature for beam parameter q (inf at a waist)."""
+
+    with np.errstate(divide='ignore'):
+        return 1/np.real(1/q)
+
+
+def propagate_q(q, M):
+    """Transform beam parameters q through a 2x2 matrix (or a stack of
+    matricies broadcast against q).  Returns the new q and the Gouy phase
+    accumulated through the element (radians).
+    """
+
+    M = np.asarray(M, dtype=float)
+    A, B = M[...,0,0], M[...,0,1]
+    C, D = M[...,1,0], M[...,1,1]
+
+    q_out = (A*q + B)/(C*q + D)
+    gouy = -np.angle(A + B/q)
+
+    return q_out, gouy
+
+
+def propagate_beams(w0, wavelength, matricies, z0=0.0):
+    """Propagate a set of gaussian beams through a sequence of ABCD matricies.
+
+    Parameters
+    ----------
+    w0 : float or ndarray
+        Waist radius of each beam
+    wavelength : float or ndarray
+        Wavelength of each beam (broadcast against w0)
+    matricies : list or OpticalSystem
+        Sequence of 2x2 transfer matricies, or an OpticalSystem
+    z0 : float or ndarray (optional)
+        Distance from the waist to the input plane.  Default is 0
+
+    Returns
+    -------
+    q : complex ndarray
+        Beam parameter at every plane, shape (beams..., planes)
+    w : ndarray
+        Beam radius at every plane
+    R : ndarray
+        Radius of curvature at every plane
+    gouy : ndarray
+        Gouy phase accumulated from the input plane (radians)
+    """
+
+    matricies = getattr(matricies, 'matricies', matricies)
+    mats = np.asarray(matricies, dtype=float).reshape(-1,2,2)
+    w0, wavelength = np.broadcast_arrays(w0, wavelength)
+
+    q = np.empty(w0.shape + (mats.shape[0]+1,), dtype=complex)
+    gouy = np.zeros(q.shape)
+    q[...,0] = q_from_waist(w0, wavelength, z0)
+    for j in range(mats.shape[0]):
+        q[...,j+1], dpsi = propagate_q(q[...,j], mats[j])
+        gouy[...,j+1] = gouy[...,j] + dpsi
+
+    wl = wavelength[...,None]
+    return q, beam_radius(q, wl), radius_of_curvature(q), gouy
+
+
+def caustic(w0, wavelength, matricies, num=100, z0=0.0):
+    """Sample gaussian beams continuously along the optical axis, for beam
+    caustic plots.  Every free space element (A = D = 1, C = 0) is sampled at
+    num points; other elements (lenses, refractions) act at a single plane.
+
+    Parameters
+    ----------
+    w0 : float or ndarray
+        Waist radius of each beam
+    wavelength : float or ndarray
+        Wavelength of each beam (broadcast against w0)
+    matricies : list or OpticalSystem
+        Sequence of 2x2 transfer matricies, or an OpticalSystem
+    num : int (optional)
+        Samples per free space segment.  Default is 100
+    z0 : float or ndarray (optional)
+        Distance from the waist to the input plane.  Default is 0
+
+    Returns
+    -------
+    z : ndarray
+        Axial (reduced) position of each sample, shape (samples,)
+    w : ndarray
+        Beam radius at each sample, shape (beams..., samples)
+    gouy : ndarray
+        Gouy phase at each sample (radians)
+    """
+
+    matricies = getattr(matricies, 'matricies', matricies)
+    mats = np.asarray(matricies, dtype=float).reshape(-1,2,2)
+    w0, wavelength = np.broadcast_arrays(w0, wavelength)
+    wl = wavelength[...,None]
+
+    q = q_from_waist(w0, wavelength, z0)
+    psi = np.zeros(q.shape)
+    position = 0.0
+    z = [np.zeros(1)]
+    w = [beam_radius(q, wavelength)[...,None]]
+    gouy = [psi[...,None]]
+
+    for M in mats:
+        (A, B), (C, D) = M
+        if A == 1 and D == 1 and C == 0 and B > 0:
+            #free space: q(s) = q + s for every beam and sample at once
+            s = np.linspace(0, B, num+1)[1:]
+            qs = q[...,None] + s
+            z.append(position + s)
+            w.append(beam_radius(qs, wl))
+            x, y = q.real[...,None], q.imag[...,None]
+            gouy.append(psi[...,None] + np.arctan((x + s)/y) - np.arctan(x/y))
+            position += B
+            q = qs[...,-1]
+            psi = gouy[-1][...,-1]
+        else:
+            q, dpsi = propagate_q(q, M)
+            psi = psi + dpsi
+            z.append(np.array([position]))
+            w.append(beam_radius(q, wavelength)[...,None])
+            gouy.append(psi[...,None])
+
+    return (np.concatenate(z), np.concatenate(w, axis=-1),
+            np.concatenate(gouy, axis=-1))
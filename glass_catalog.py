@@ -0,0 +1,742 @@
+# -*- coding: utf-8 -*-
+"""
+Glass data and refractive index evaluation.
+
+Glass data is read from the vendor catalog CSVs shipped with the repo (Ohara
+and Schott) and cached as binary columnar files (.npz) outside the working
+directory, so loading is a few milliseconds.  A cache is rebuilt only when the
+checksum of its CSV changes.  Both vendors are parsed into the same columns:
+
+    vendor        'OHARA' or 'SCHOTT'
+    code          6 digit glass code, nnnvvv from nd and vd
+    nd, vd        index and Abbe number at the d-line
+    dndt          dn/dT constants D0, D1, D2, E0, E1, lambda_tk (microns)
+                  of the absolute index
+    cte           thermal expansion coefficient, -30/+70 C (1/K)
+    transmission  internal transmittance of a 10 mm sample, on the wavelength
+                  grid axes['transmission_nm'] (NaN where not listed)
+    density       g/cm^3
+
+Sellmeier coefficients of both vendors are evaluated with the same form of
+the Sellmeier equation, wavelength in microns:
+
+    n**2 - 1 = A1*L**2/(L**2 - B1) + A2*L**2/(L**2 - B2) + A3*L**2/(L**2 - B3)
+
+GlassCatalog holds the coefficients of every glass in contiguous arrays and
+evaluates the whole catalog over a wavelength grid as one (glasses,
+wavelengths) array.  Indices for a given wavelength grid are memoized, so
+repeated evaluations (ex: every propagation over the same spectrum) are
+lookups.
+
+"""
+
+import csv
+import hashlib
+import os
+from functools import lru_cache
+
+import numpy as np
+
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+OHARA_CSV = os.path.join(DATA_DIR, 'OHARA_20171130_6.csv')
+SCHOTT_CSV = os.path.join(DATA_DIR, 'schott-optical-glass-06032017.csv')
+
+#binary catalog caches, kept out of the working directory
+CACHE_DIR = os.environ.get('OPTICAL_CALCS_CACHE',
+                           os.path.join(os.path.expanduser('~'), '.cache',
+                                        'optical-calculations'))
+#bump when the cached schema changes so old caches are rebuilt
+_CACHE_VERSION = 3
+
+#names treated as index 1.0
+AIR = ('air', 'AIR', 'Air', '')
+
+#Fraunhofer and laser lines, wavelength in microns
+LINES = {'t': 1.01398, 's': 0.85211, 'r': 0.706519, 'C': 0.6562725,
+         "C'": 0.6438469, 'HeNe': 0.6328, 'D': 0.5892938, 'd': 0.5875618,
+         'e': 0.546074, 'F': 0.4861327, "F'": 0.4799914, 'g': 0.4358343,
+         'h': 0.4046561, 'i': 0.3650146}
+
+
+def air_index(wavelength, temperature=20.0, pressure=101325.0):
+    """Index of dry air at a wavelength (microns), temperature (C) and
+    pressure (Pa), from the Edlen form used by Schott (TIE-19).  Broadcasts
+    over its arguments."""
+
+    L2inv = 1/np.asarray(wavelength, dtype=float)**2
+    n15 = 1 + 1e-8*(6432.8 + 2949810/(146 - L2inv) + 25540/(41 - L2inv))
+    dT = np.asarray(temperature, dtype=float) - 15
+
+    return 1 + (n15 - 1)/(1 + 3.4785e-3*dT)*pressure/101325
+
+
+def sellmeier(A, B, wavelength):
+    """Refractive index from Sellmeier coefficients.
+
+    Parameters
+    ----------
+    A : ndarray
+        Numerator coefficients (A1, A2, A3), shape (..., 3)
+    B : ndarray
+        Resonance coefficients (B1, B2, B3) in um^2, shape (..., 3)
+    wavelength : float or ndarray
+        Wavelength in microns, broadcast against the leading axes of A and B
+
+    Returns
+    -------
+    n : ndarray
+        Refractive index
+    """
+
+    A = np.asarray(A, dtype=float)
+    B = np.asarray(B, dtype=float)
+    L2 = np.asarray(wavelength, dtype=float)**2
+    n2 = 1.0
+    for i in range(3):
+        n2 = n2 + A[...,i]*L2/(L2 - B[...,i])
+
+    return np.sqrt(n2)
+
+
+class GlassCatalog:
+    """ A set of glasses with Sellmeier coefficients stored in contiguous
+    arrays, evaluated together.
+
+    Parameters
+    ----------
+    names : list of str
+        Glass names (spaces are removed for lookups)
+    A : array_like
+        Sellmeier numerator coefficients, shape (glasses, 3)
+    B : array_like
+        Sellmeier resonance coefficients in um^2, shape (glasses, 3)
+    columns : dict (optional)
+        Other per-glass data keyed by column name (ex: 'nd', 'vd', 'code'),
+        each an array with glasses along the first axis
+    axes : dict (optional)
+        Sample grids shared by all glasses (ex: 'transmission_nm')
+    memo_size : int (optional)
+        Number of wavelength grids whose index tables are kept.  Default 32
+    """
+
+    def __init__(self, names, A, B, columns=None, axes=None, memo_size=32):
+        self.names = [n.replace(' ', '') for n in names]
+        self.rows = {n: i for i, n in enumerate(self.names)}
+        self.columns = {k: np.asarray(v) for k, v in (columns or {}).items()}
+        self.axes = {k: np.asarray(v) for k, v in (axes or {}).items()}
+
+        #glass code -> rows (codes are shared by glasses like F2 and F2HT)
+        self.codes = {}
+        for i, code in enumerate(self.columns.get('code', ())):
+            self.codes.setdefault(str(code), []).append(i)
+
+        #coefficient columns shaped (3, glasses, 1) to broadcast over wavelength
+        self.A = np.ascontiguousarray(np.asarray(A, dtype=float).T[:,:,None])
+        self.B = np.ascontiguousarray(np.asarray(B, dtype=float).T[:,:,None])
+
+        self.memo_size = memo_size
+        self._memo = {}
+        self._transmission = None
+
+
+    @classmethod
+    def ohara(cls, csv_path=OHARA_CSV, cache_dir=CACHE_DIR):
+        """The Ohara catalog (see load_ohara)."""
+        return load_ohara(csv_path, cache_dir)
+
+
+    @classmethod
+    def load(cls, path):
+        """Read a catalog written by save."""
+
+        with np.load(path) as f:
+            arrays = {k: f[k] for k in f.files}
+        return cls._from_arrays(arrays)
+
+
+    @classmethod
+    def _from_arrays(cls, arrays):
+        columns = {k[4:]: v for k, v in arrays.items() if k.startswith('col_')}
+        axes = {k[5:]: v for k, v in arrays.items() if k.startswith('axis_')}
+        return cls(arrays['names'].tolist(), arrays['A'], arrays['B'], columns,
+                   axes)
+
+
+    def _arrays(self):
+        arrays = {'names': np.array(self.names), 'A': self.sellmeier_A,
+                  'B': self.sellmeier_B}
+        arrays.update(('col_' + k, v) for k, v in self.columns.items())
+        arrays.update(('axis_' + k, v) for k, v in self.axes.items())
+        return arrays
+
+
+    @classmethod
+    def concatenate(cls, catalogs):
+        """Merge catalogs with the same columns into one.  Columns sampled on
+        an axis (ex: transmission) are placed on the union of the grids, NaN
+        where a catalog has no sample."""
+
+        catalogs = list(catalogs)
+        names = [n for c in catalogs for n in c.names]
+        A = np.concatenate([c.sellmeier_A for c in catalogs])
+        B = np.concatenate([c.sellmeier_B for c in catalogs])
+
+        axes = {k: np.unique(np.concatenate([c.axes[k] for c in catalogs]))
+                for k in catalogs[0].axes}
+        columns = {}
+        for key in catalogs[0].columns:
+            axis = _AXIS_COLUMNS.get(key)
+            if axis is None:
+                columns[key] = np.concatenate([c[key] for c in catalogs])
+                continue
+            parts = []
+            for c in catalogs:
+                part = np.full((len(c), axes[axis].size), np.nan)
+                part[:,np.searchsorted(axes[axis], c.axes[axis])] = c[key]
+                parts.append(part)
+            columns[key] = np.concatenate(parts)
+
+        return cls(names, A, B, columns, axes)
+
+
+    @property
+    def sellmeier_A(self):
+        """Sellmeier numerator coefficients, shape (glasses, 3)."""
+        return self.A[:,:,0].T
+
+
+    @property
+    def sellmeier_B(self):
+        """Sellmeier resonance coefficients (um^2), shape (glasses, 3)."""
+        return self.B[:,:,0].T
+
+
+    def save(self, path, **extra):
+        """Write the catalog as an uncompressed .npz of its columns.  extra
+        arrays (ex: a source checksum) are stored alongside."""
+
+        np.savez(path, **self._arrays(), **extra)
+
+
+    def __len__(self):
+        return len(self.names)
+
+
+    def __getitem__(self, column):
+        """Per-glass data column by name (ex: catalog['nd'])."""
+        return self.columns[column]
+
+
+    def __contains__(self, name):
+        return name.replace(' ', '') in self.rows
+
+
+    def row(self, name):
+        """Row index of a glass by name."""
+
+        try:
+            return self.rows[name.replace(' ', '')]
+        except KeyError:
+            raise KeyError('unknown glass: {}'.format(name)) from None
+
+
+    def rows_for_code(self, code):
+        """Row indices of the glasses with a glass code, ex: 517642 or
+        '620364.360' (only the leading nnnvvv digits are used)."""
+
+        try:
+            return self.codes[_glass_code(str(code))]
+        except KeyError:
+            raise KeyError('unknown glass code: {}'.format(code)) from None
+
+
+    def glass(self, name):
+        """All columns of one glass as a dict."""
+
+        i = self.row(name)
+        record = {'name': self.names[i], 'A': self.sellmeier_A[i],
+                  'B': self.sellmeier_B[i]}
+        record.update((k, v[i]) for k, v in self.columns.items())
+        return record
+
+
+    def index(self, wavelengths):
+        """Refractive index of every glass at every wavelength (microns).
+        Returns a read-only array of shape (glasses, W); results for repeated
+        wavelength grids are memoized.
+        """
+
+        wavelengths = np.atleast_1d(np.asarray(wavelengths, dtype=float))
+        key = wavelengths.tobytes()
+        n = self._memo.get(key)
+        if n is None:
+            L2 = wavelengths**2
+            n2 = np.ones((len(self), wavelengths.size))
+            for i in range(3):
+                n2 += self.A[i]*L2/(L2 - self.B[i])
+            n = np.sqrt(n2, out=n2)
+            n.flags.writeable = False
+
+            if len(self._memo) >= self.memo_size:
+                self._memo.pop(next(iter(self._memo)))
+            self._memo[key] = n
+
+        return n
+
+
+    def glass_index(self, name, wavelengths):
+        """Refractive index of one glass at the given wavelengths (microns)."""
+
+        wavelengths = np.asarray(wavelengths, dtype=float)
+        g = self.row(name)
+        n = sellmeier(self.A[:,g,0], self.B[:,g,0], wavelengths[...,None])
+        return n.reshape(wavelengths.shape)
+
+
+    def line_indices(self, lines=('d', 'F', 'C')):
+        """Index of every glass at the named spectral lines (see LINES).
+        Returns an array of shape (glasses, len(lines))."""
+
+        return self.index([LINES[l] for l in lines])
+
+
+    def abbe_numbers(self, lines=('d', 'F', 'C')):
+        """Abbe number (n_mid - 1)/(n_short - n_long) of every glass.  The
+        default is Vd from the d, F and C lines; use ('e', "F'", "C'") for Ve.
+        """
+
+        n = self.line_indices(lines)
+        return (n[:,0] - 1)/(n[:,1] - n[:,2])
+
+
+    def partial_dispersions(self, x='g', y='F', lines=('F', 'C')):
+        """Relative partial dispersion P_x,y = (n_x - n_y)/(n_F - n_C) of
+        every glass, ex: P_g,F (the default)."""
+
+        n = self.line_indices((x, y) + tuple(lines))
+        return (n[:,0] - n[:,1])/(n[:,2] - n[:,3])
+
+
+    def dn_dlambda(self, wavelengths):
+        """Dispersion dn/dlambda (per micron) of every glass at every
+        wavelength, shape (glasses, W).  From the derivative of the Sellmeier
+        equation: n dn/dL = -sum(A*B*L/(L**2 - B)**2)."""
+
+        wavelengths = np.atleast_1d(np.asarray(wavelengths, dtype=float))
+        L = wavelengths
+        L2 = L**2
+        d = np.zeros((len(self), L.size))
+        for i in range(3):
+            d -= self.A[i]*self.B[i]*L/(L2 - self.B[i])**2
+
+        return d/self.index(wavelengths)
+
+
+    def _transmission_table(self):
+        """Dense 10 mm internal transmittance with no gaps, and its monotone
+        (PCHIP) slopes, built on first use.  Gaps in a glass's data (grid
+        points listed only by other vendors) are filled by monotone
+        interpolation of that glass's own samples; outside its measured range
+        the end values are held."""
+
+        if self._transmission is None:
+            x = self.axes['transmission_nm']/1000
+            tau = np.array(self['transmission'], dtype=float)
+            for g in np.nonzero(np.isnan(tau).any(axis=1))[0]:
+                valid = ~np.isnan(tau[g])
+                if valid.sum() >= 2:
+                    xv, yv = x[valid], tau[g,valid]
+                    tau[g] = _pchip(xv, yv, _pchip_slopes(xv, yv), x)
+            self._transmission = (x, tau, _pchip_slopes(x, tau))
+
+        return self._transmission
+
+
+    def transmission(self, wavelengths, thickness=10.0, rows=None):
+        """Internal transmittance of every glass (or of the given rows) at
+        every wavelength (microns), for a thickness in mm.
+
+        The 10 mm catalog data is interpolated monotonically (PCHIP, so no
+        overshoot between samples) and scaled by Beer-Lambert,
+        tau(t) = tau_10**(t/10).  thickness broadcasts in front of the result,
+        giving shape (..., glasses, W).
+        """
+
+        wavelengths = np.atleast_1d(np.asarray(wavelengths, dtype=float))
+        x, tau, d = self._transmission_table()
+        rows = slice(None) if rows is None else rows
+        tau10 = np.clip(_pchip(x, tau[rows], d[rows], wavelengths), 0, 1)
+        t = np.asarray(thickness, dtype=float)[...,None,None]
+
+        return tau10**(t/10)
+
+
+    def absorption(self, wavelengths, rows=None):
+        """Internal absorption coefficient (1/mm), -ln(tau_10)/10, of every
+        glass at every wavelength (microns), shape (glasses, W)."""
+
+        with np.errstate(divide='ignore'):
+            return -np.log(self.transmission(wavelengths, 10.0, rows))/10
+
+
+    def thermal_index(self, wavelengths, temperatures, rows=None):
+        """Index of every glass (or of the given rows) at every temperature
+        and wavelength, shape (glasses, T, W).
+
+        Uses the Schott (TIE-19) model of the absolute index change from
+        20 C with the catalog dn/dT constants,
+
+            dn_abs = (n**2 - 1)/(2n)*(D0*dT + D1*dT**2 + D2*dT**3
+                                      + (E0*dT + E1*dT**2)/(L**2 - L_tk**2))
+
+        and returns the index relative to air at the same temperature (the
+        convention of the catalog indices, for systems in air).  Glasses
+        without dn/dT data give NaN.
+
+        Parameters
+        ----------
+        wavelengths : array_like
+            Wavelengths in microns, shape (W,)
+        temperatures : array_like
+            Temperatures in C, shape (T,)
+        rows : array_like (optional)
+            Catalog rows to evaluate.  Default is every glass
+        """
+
+        wavelengths = np.atleast_1d(np.asarray(wavelengths, dtype=float))
+        T = np.atleast_1d(np.asarray(temperatures, dtype=float))[:,None]
+        rows = slice(None) if rows is None else rows
+
+        n_abs = (self.index(wavelengths)[rows]*air_index(wavelengths))[:,None]
+        D0, D1, D2, E0, E1, L_tk = self['dndt'][rows].T[...,None,None]
+        dT = T - 20
+        dn = (n_abs**2 - 1)/(2*n_abs)*(
+            dT*(D0 + dT*(D1 + dT*D2))
+            + dT*(E0 + dT*E1)/(wavelengths**2 - L_tk**2))
+
+        return (n_abs + dn)/air_index(wavelengths, T)
+
+
+def _checksum(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+#columns sampled on a catalog axis
+_AXIS_COLUMNS = {'transmission': 'transmission_nm'}
+
+
+def _float(text):
+    text = text.strip()
+    return float(text) if text else np.nan
+
+
+def _glass_code(text):
+    return text.strip().split('.')[0]
+
+
+def _csv_rows(path, encoding='latin-1'):
+    """Stream the rows of a vendor CSV."""
+
+    with open(path, newline='', encoding=encoding) as f:
+        yield from csv.reader(f)
+
+
+class _Columns:
+    """Accumulates parsed rows into the shared catalog schema."""
+
+    def __init__(self, vendor, transmission_nm):
+        self.vendor = vendor
+        self.transmission_nm = np.asarray(transmission_nm, dtype=float)
+        self.names, self.codes, self.rows = [], [], []
+
+    def add(self, name, code, nd, vd, A, B, dndt, transmission, density,
+            cte):
+        self.names.append(name.replace(' ', ''))
+        self.codes.append(_glass_code(code))
+        self.rows.append([nd, vd, density, cte] + A + B + dndt + transmission)
+
+    def catalog(self):
+        data = np.array(self.rows, dtype=float).reshape(len(self.names), -1)
+        columns = {'vendor': np.array([self.vendor]*len(self.names)),
+                   'code': np.array(self.codes),
+                   'nd': data[:,0],
+                   'vd': data[:,1],
+                   'density': data[:,2],
+                   'cte': data[:,3],
+                   'dndt': data[:,10:16],
+                   'transmission': data[:,16:]}
+
+        #sort the transmission grid (Schott lists it longest first)
+        order = np.argsort(self.transmission_nm)
+        columns['transmission'] = columns['transmission'][:,order]
+        axes = {'transmission_nm': self.transmission_nm[order]}
+
+        return GlassCatalog(self.names, data[:,4:7], data[:,7:10], columns,
+                            axes)
+
+
+def parse_ohara_csv(path=OHARA_CSV):
+    """Parse the Ohara catalog CSV (two header rows, one glass per row) with
+    the csv module.  Returns a GlassCatalog.
+
+    Columns kept: glass name (1), code (2), nd (16), vd (26), Sellmeier A1-A3
+    (60-62) and B1-B3 (63-65), 10 mm internal transmission 280-2400 nm
+    (80-111), dn/dT constants (154-159), expansion -30/+70 C in 1e-7/K
+    (165), specific gravity (182).
+    """
+
+    rows = _csv_rows(path)
+    next(rows)
+    header = next(rows)
+    parsed = _Columns('OHARA', [float(h) for h in header[80:112]])
+
+    for r in rows:
+        if len(r) < 183 or not r[1].strip():
+            continue
+        def get(start, stop=None):
+            return [_float(r[i]) for i in range(start, stop or start+1)]
+        parsed.add(r[1], r[2], *get(16), *get(26), get(60, 63), get(63, 66),
+                   get(154, 160), get(80, 112), *get(182), get(165)[0]*1e-7)
+
+    return parsed.catalog()
+
+
+def parse_schott_csv(path=SCHOTT_CSV):
+    """Parse the Schott catalog CSV with the csv module.  Returns a
+    GlassCatalog.
+
+    The file is latin-1 encoded (not utf-8) and has a multi-row header: title
+    and group rows, then one row of column names starting with 'Glass'.
+    Columns are found by name, so the parser doesn't depend on their order.
+    Schott's Sellmeier constants B1-B3, C1-C3 are the same form as Ohara's
+    A1-A3, B1-B3.
+    """
+
+    rows = _csv_rows(path, 'latin-1')
+    for r in rows:
+        if r and r[0].strip() == 'Glass':
+            break
+    else:
+        raise ValueError('no header row found in {}'.format(path))
+
+    col = {}
+    for i, h in enumerate(r):
+        col.setdefault(h.strip(), i)
+    tau = [h for h in col if h.startswith('TAUI10/')]
+    tau_cols = [col[h] for h in tau]
+
+    def get(r, *names):
+        return [_float(r[col[n]]) for n in names]
+
+    parsed = _Columns('SCHOTT', [float(h.split('/')[1]) for h in tau])
+    for r in rows:
+        if not r or not r[0].strip():
+            continue
+        nd, vd, density, cte = get(r, 'nd', 'vd', 'Density', 'alpha -30/70')
+        parsed.add(r[0], r[col['Glascode']], nd, vd,
+                   get(r, 'B1', 'B2', 'B3'), get(r, 'C1', 'C2', 'C3'),
+                   get(r, 'D0', 'D1', 'D2', 'E0', 'E1', 'lambda'),
+                   [_float(r[c]) for c in tau_cols], density, cte*1e-6)
+
+    return parsed.catalog()
+
+
+def _cached_catalog(csv_path, cache_dir, parse):
+    """Load a catalog from its .npz cache in cache_dir, rebuilding the cache
+    with parse(csv_path) when the CSV checksum (or cache version) differs.
+    The cache is skipped if cache_dir is None or not writable."""
+
+    checksum = _checksum(csv_path)
+    if cache_dir is None:
+        return parse(csv_path)
+
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    cache = os.path.join(cache_dir, name + '.npz')
+    try:
+        with np.load(cache) as f:
+            if (str(f['checksum']) == checksum
+                and int(f['version']) == _CACHE_VERSION):
+                return GlassCatalog._from_arrays(
+                    {k: f[k] for k in f.files
+                     if k not in ('checksum', 'version')})
+    except (OSError, KeyError, ValueError):
+        pass
+
+    catalog = parse(csv_path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = '{}.{}.tmp.npz'.format(cache[:-4], os.getpid())
+        catalog.save(tmp, checksum=checksum, version=_CACHE_VERSION)
+        os.replace(tmp, cache)
+    except OSError:
+        pass
+
+    return catalog
+
+
+def load_ohara(csv_path=OHARA_CSV, cache_dir=CACHE_DIR):
+    """Load the Ohara catalog from the binary cache, rebuilding it from the
+    vendor CSV only when the CSV has changed.  Nothing is plotted or written
+    to the working directory.
+
+    Parameters
+    ----------
+    csv_path : str (optional)
+        Ohara catalog CSV.  Default is the copy in the repo
+    cache_dir : str or None (optional)
+        Directory for the .npz cache (default CACHE_DIR, which can be set
+        with the OPTICAL_CALCS_CACHE environment variable).  None disables
+        the cache
+
+    Returns
+    -------
+    catalog : GlassCatalog
+    """
+
+    return _cached_catalog(csv_path, cache_dir, parse_ohara_csv)
+
+
+def load_schott(csv_path=SCHOTT_CSV, cache_dir=CACHE_DIR):
+    """Load the Schott catalog, cached like load_ohara."""
+    return _cached_catalog(csv_path, cache_dir, parse_schott_csv)
+
+
+def load_catalog(vendors=('OHARA', 'SCHOTT'), cache_dir=CACHE_DIR):
+    """Merged multi-vendor catalog with a vendor column, in the order given.
+
+    Parameters
+    ----------
+    vendors : sequence of str (optional)
+        Any of 'OHARA' and 'SCHOTT'.  Default is both
+    cache_dir : str or None (optional)
+        Directory for the .npz caches (see load_ohara)
+
+    Returns
+    -------
+    catalog : GlassCatalog
+    """
+
+    loaders = {'OHARA': load_ohara, 'SCHOTT': load_schott}
+    catalogs = [loaders[v.upper()](cache_dir=cache_dir) for v in vendors]
+    if len(catalogs) == 1:
+        return catalogs[0]
+    return GlassCatalog.concatenate(catalogs)
+
+
+def _pchip_slopes(x, y):
+    """Fritsch-Carlson monotone cubic slopes for samples y (..., N) at
+    increasing x (N,)."""
+
+    h = np.diff(x)
+    delta = np.diff(y, axis=-1)/h
+    d = np.zeros(y.shape)
+    if x.size < 3:
+        d[...] = delta[...,:1]
+        return d
+
+    #weighted harmonic mean of the secants, 0 at local extrema
+    w1 = 2*h[1:] + h[:-1]
+    w2 = h[1:] + 2*h[:-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        harmonic = (w1 + w2)/(w1/delta[...,:-1] + w2/delta[...,1:])
+    same_sign = delta[...,:-1]*delta[...,1:] > 0
+    d[...,1:-1] = np.where(same_sign, harmonic, 0.0)
+
+    #shape preserving three point end slopes
+    ends = ((0, h[0], h[1], delta[...,0], delta[...,1]),
+            (-1, h[-1], h[-2], delta[...,-1], delta[...,-2]))
+    for end, h0, h1, d0, d1 in ends:
+        e = ((2*h0 + h1)*d0 - h0*d1)/(h0 + h1)
+        e = np.where(np.sign(e) != np.sign(d0), 0.0, e)
+        clip = (np.sign(d0) != np.sign(d1)) & (np.abs(e) > 3*np.abs(d0))
+        d[...,end] = np.where(clip, 3*d0, e)
+
+    return d
+
+
+def _pchip(x, y, d, xq):
+    """Evaluate the cubic Hermite interpolant of samples y (..., N) with
+    slopes d at points xq, holding the end values outside x."""
+
+    i = np.clip(np.searchsorted(x, xq, side='right') - 1, 0, x.size - 2)
+    h = x[i+1] - x[i]
+    t = np.clip((xq - x[i])/h, 0, 1)
+    t2 = t*t
+
+    return (y[...,i]*(1 + 2*t)*(1 - t)**2 + d[...,i]*h*t*(1 - t)**2
+            + y[...,i+1]*t2*(3 - 2*t) + d[...,i+1]*h*t2*(t - 1))
+
+
+@lru_cache(maxsize=1)
+def default_catalog():
+    """The catalog used for glass name lookups (Ohara and Schott)."""
+    return load_catalog()
+
+
+@lru_cache(maxsize=1024)
+def _glass_index(name, wavelength_bytes):
+    n = default_catalog().glass_index(name, np.frombuffer(wavelength_bytes))
+    n.flags.writeable = False
+    return n
+
+
+def glass_index(name, wavelength):
+    """Refractive index of a catalog glass (ex: 'S-BSL7') at one or more
+    wavelengths (microns).  Results are memoized per glass and wavelength grid.
+    """
+
+    wavelength = np.asarray(wavelength, dtype=float)
+    n = _glass_index(name, np.ascontiguousarray(wavelength).tobytes())
+    return n.reshape(wavelength.shape)
+
+
+def thermal_material_index(material, wavelengths, temperatures):
+    """Index of a material (number, 'air' or catalog glass name) relative to
+    air at every temperature (C) and wavelength (microns), shape (T, W).
+    Numbers and air don't change with temperature."""
+
+    wavelengths = np.atleast_1d(np.asarray(wavelengths, dtype=float))
+    T = np.atleast_1d(np.asarray(temperatures, dtype=float))
+    if isinstance(material, str) and material not in AIR:
+        catalog = default_catalog()
+        return catalog.thermal_index(wavelengths, T, [catalog.row(material)])[0]
+
+    n = material_index(material, wavelengths)
+    return np.broadcast_to(n, (T.size, wavelengths.size))
+
+
+def material_absorption(material, wavelengths):
+    """Internal absorption coefficient (1/mm) of a material at each
+    wavelength (microns), shape (W,).  Zero for air and numeric indices."""
+
+    wavelengths = np.atleast_1d(np.asarray(wavelengths, dtype=float))
+    if isinstance(material, str) and material not in AIR:
+        catalog = default_catalog()
+        return catalog.absorption(wavelengths, [catalog.row(material)])[0]
+    return np.zeros(wavelengths.shape)
+
+
+def expansion_coefficient(material, default=0.0):
+    """Thermal expansion coefficient (1/K) of a catalog glass, or default for
+    air and other materials."""
+
+    if isinstance(material, str) and material not in AIR:
+        catalog = default_catalog()
+        return float(catalog['cte'][catalog.row(material)])
+    return default
+
+
+def material_index(material, wavelength):
+    """Index of a material given either as a number (constant index), 'air',
+    or a catalog glass name, broadcast to the shape of wavelength (microns).
+    """
+
+    wavelength = np.asarray(wavelength, dtype=float)
+    if isinstance(material, str):
+        if material in AIR:
+            return np.ones(wavelength.shape)
+        return glass_index(material, wavelength)
+
+    return np.broadcast_to(np.asarray(material, dtype=float), wavelength.shape)
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+Spatial index over the glass map (nd vs. Abbe number) for finding substitute
+glasses and selecting regions of the map.
+
+Glasses are placed at normalized coordinates (nd, vd and optionally P g,F,
+each scaled to zero mean and unit standard deviation over the catalog) and
+bucketed into a uniform grid of cells, stored CSR style: the glass rows
+sorted by cell, plus the start of each cell in that order.  Queries only look
+at the cells that can hold an answer, then finish with exact distances.  A
+block of cells is a few contiguous runs of that order (one per row of cells),
+so gathering it costs a handful of array operations.
+
+Below BRUTE_FORCE_SIZE glasses (ex: one or two vendor catalogs) a vectorized
+scan of every point is faster than any index, so nearest and within use that
+instead; the grid takes over for larger merged catalogs.
+
+Distances and radii are in normalized units (standard deviations), so one
+unit of nd difference weighs the same as one unit of vd difference.
+
+"""
+
+from itertools import product
+
+import numpy as np
+
+from glass_catalog import default_catalog
+
+
+#catalogs smaller than this are scanned instead of using the grid
+BRUTE_FORCE_SIZE = 1024
+
+
+class GlassMap:
+    """ Grid index of a glass catalog on the (nd, vd[, P g,F]) map.
+
+    Parameters
+    ----------
+    catalog : GlassCatalog (optional)
+        Glasses to index.  Default is the merged vendor catalog
+    partial_dispersion : bool (optional)
+        Also index the relative partial dispersion P g,F.  Default is False
+    per_cell : float (optional)
+        Average number of glasses per grid cell.  Default is 2
+    brute_force : bool (optional)
+        Scan every glass for nearest and within queries instead of using the
+        grid.  Default is True below BRUTE_FORCE_SIZE glasses
+    """
+
+    def __init__(self, catalog=None, partial_dispersion=False, per_cell=2.0,
+                 brute_force=None):
+        self.catalog = default_catalog() if catalog is None else catalog
+        cols = [self.catalog['nd'], self.catalog['vd']]
+        if partial_dispersion:
+            cols.append(self.catalog.partial_dispersions())
+        raw = np.column_stack(cols)
+
+        self.center = raw.mean(axis=0)
+        self.scale = raw.std(axis=0)
+        self.points = (raw - self.center)/self.scale
+        num, dim = self.points.shape
+
+        #cubic cells sized for about per_cell glasses each
+        self.lo = self.points.min(axis=0)
+        extent = np.maximum(self.points.max(axis=0) - self.lo, 1e-12)
+        self.cell = (np.prod(extent)*per_cell/num)**(1/dim)
+        self.shape = (extent//self.cell).astype(int) + 1
+        self.per_cell = per_cell
+
+        cells = np.ravel_multi_index(self._cell_coords(self.points).T,
+                                     self.shape)
+        self.order = np.argsort(cells, kind='stable')
+        self.starts = np.searchsorted(cells[self.order],
+                                      np.arange(np.prod(self.shape) + 1))
+        #cell id steps along each axis (the last axis is contiguous)
+        self.strides = np.cumprod(np.r_[1, self.shape[:0:-1]])[::-1].tolist()
+
+        if brute_force is None:
+            brute_force = num < BRUTE_FORCE_SIZE
+        self.brute_force = brute_force
+
+
+    def __len__(self):
+        return self.points.shape[0]
+
+
+    def normalize(self, nd, vd, pgf=None):
+        """Map coordinates of a point (raw nd, vd[, P g,F])."""
+
+        point = [nd, vd] if pgf is None else [nd, vd, pgf]
+        point = np.asarray(point[:self.points.shape[1]], dtype=float)
+        if point.size < self.points.shape[1]:
+            raise ValueError('P g,F is required by this index')
+        return (point - self.center)/self.scale
+
+
+    def _cell_coords(self, points):
+        return ((points - self.lo)//self.cell).astype(int)
+
+
+    def _cell_block(self, q, radius):
+        """Bounds (lists of ints) of the cells within radius of q."""
+        return (self._cell_coords(q - radius).tolist(),
+                self._cell_coords(q + radius).tolist())
+
+
+    def _gather(self, lo, hi):
+        """Rows in the block of cells lo..hi (inclusive, clipped to the
+        grid)."""
+
+        lo = [max(a, 0) for a in lo]
+        hi = [min(b, s - 1) for b, s in zip(hi, self.shape.tolist())]
+        if any(b < a for a, b in zip(lo, hi)):
+            return np.empty(0, dtype=int)
+
+        #one contiguous run of self.order per row of cells along the last
+        #axis; block bounds are python ints, as tiny arrays cost more
+        width = hi[-1] - lo[-1] + 1
+        runs = []
+        for lead in product(*[range(a, b + 1) for a, b in zip(lo[:-1],
+                                                              hi[:-1])]):
+            first = lo[-1] + sum(i*s for i, s in zip(lead, self.strides))
+            runs.append(self.order[self.starts[first]:
+                                   self.starts[first + width]])
+
+        return runs[0] if len(runs) == 1 else np.concatenate(runs)
+
+
+    def _distances(self, rows, q):
+        d = self.points[rows] - q
+        return np.sqrt(np.einsum('ij,ij->i', d, d))
+
+
+    def _nearest(self, dist, k):
+        """Positions of the k smallest distances, nearest first."""
+
+        best = np.arange(dist.size)
+        if k < dist.size:
+            best = np.argpartition(dist, k-1)[:k]
+        return best[np.argsort(dist[best], kind='stable')]
+
+
+    def nearest(self, nd, vd, pgf=None, k=1, exclude=None):
+        """The k glasses nearest to a point on the map.
+
+        Parameters
+        ----------
+        nd, vd : float
+            Index and Abbe number of the point
+        pgf : float (optional)
+            Partial dispersion, when the index includes it
+        k : int (optional)
+            Number of glasses.  Default is 1
+        exclude : int (optional)
+            Row to leave out (ex: the glass being substituted)
+
+        Returns
+        -------
+        rows : ndarray
+            Catalog rows, nearest first
+        distances : ndarray
+            Normalized distances
+        """
+
+        q = self.normalize(nd, vd, pgf)
+        k = min(k, len(self) - (exclude is not None))
+
+        if self.brute_force:
+            d = self.points - q
+            dist = np.einsum('ij,ij->i', d, d)
+            if exclude is not None:
+                dist[exclude] = np.inf
+            best = self._nearest(dist, k)
+            return best, np.sqrt(dist[best])
+
+        #grow a block of cells around the query until it holds k glasses,
+        #starting from the block expected to hold about k
+        qc = self._cell_coords(q).tolist()
+        last = (self.shape - 1).tolist()
+        dim = len(qc)
+        r = max(int(np.ceil(((k/self.per_cell)**(1/dim) - 1)/2)), 0)
+        while True:
+            rows = self._gather([c - r for c in qc], [c + r for c in qc])
+            if exclude is not None:
+                rows = rows[rows != exclude]
+            whole_grid = all(c - r <= 0 and c + r >= m
+                             for c, m in zip(qc, last))
+            if rows.size >= k or whole_grid:
+                break
+            r += 1
+
+        #every glass within the kth distance so far lies in the cells
+        #spanned by q -/+ dk; gather again only if they leave this block
+        dist = self._distances(rows, q)
+        best = self._nearest(dist, k)
+        dk = dist[best[-1]] if k else 0.0
+        lo, hi = self._cell_block(q, dk)
+        if any(a < c - r or b > c + r for a, b, c in zip(lo, hi, qc)):
+            rows = self._gather(lo, hi)
+            if exclude is not None:
+                rows = rows[rows != exclude]
+            dist = self._distances(rows, q)
+            best = self._nearest(dist, k)
+
+        return rows[best], dist[best]
+
+
+    def within(self, nd, vd, radius, pgf=None):
+        """Glasses within a normalized radius of a point, nearest first.
+        Returns (rows, distances)."""
+
+        q = self.normalize(nd, vd, pgf)
+        if self.brute_force:
+            d = self.points - q
+            dist = np.einsum('ij,ij->i', d, d)
+            rows = np.flatnonzero(dist <= radius*radius)
+            dist = np.sqrt(dist[rows])
+        else:
+            rows = self._gather(*self._cell_block(q, radius))
+            dist = self._distances(rows, q)
+            keep = dist <= radius
+            rows, dist = rows[keep], dist[keep]
+        order = np.argsort(dist, kind='stable')
+
+        return rows[order], dist[order]
+
+
+    def in_polygon(self, vertices):
+        """Glasses inside a polygon on the (nd, vd) map (even-odd rule).
+
+        Parameters
+        ----------
+        vertices : array_like
+            Polygon corners as (nd, vd) pairs, shape (V, 2)
+
+        Returns
+        -------
+        rows : ndarray
+            Catalog rows inside the polygon, in ascending order
+        """
+
+        v = ((np.asarray(vertices, dtype=float) - self.center[:2])
+             / self.scale[:2])
+
+        #candidate cells from the bounding box (all cells along P g,F)
+        lo = np.zeros(self.points.shape[1], dtype=int)
+        hi = self.shape - 1
+        lo[:2] = self._cell_coords(np.r_[v.min(axis=0), self.lo[2:]])[:2]
+        hi[:2] = self._cell_coords(np.r_[v.max(axis=0), self.lo[2:]])[:2]
+        rows = self._gather(lo.tolist(), hi.tolist())
+
+        #crossings of a ray in +vd from each point, for all edges at once
+        x, y = self.points[rows,0,None], self.points[rows,1,None]
+        x1, y1 = v[:,0], v[:,1]
+        x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            straddle = (x1 > x) != (x2 > x)
+            y_cross = y1 + (x - x1)*(y2 - y1)/(x2 - x1)
+            inside = np.count_nonzero(straddle & (y < y_cross), axis=1) % 2 == 1
+
+        return np.sort(rows[inside])
+
+
+    def substitutes(self, name, k=5):
+        """The k glasses nearest to a catalog glass, excluding itself.
+        Returns (names, distances)."""
+
+        i = self.catalog.row(name)
+        point = self.points[i]*self.scale + self.center
+        rows, dist = self.nearest(*point, k=k, exclude=i)
+
+        return [self.catalog.names[j] for j in rows], dist
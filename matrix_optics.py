@@ -11,7 +11,9 @@ embedded within a list structure for flexible adding and removing of items.
 In most optical problems, the matrix determinants have a value of one, which
 provides for a convenient check at the end of a calculation.
 
-For now, launch only a marginal and chief ray
+Rays are held in a RayBundle, a struct-of-arrays container (height, angle,
+energy, wavelength and an alive flag stored as contiguous numpy arrays), so
+millions of rays can be stored and propagated without per-ray python objects.
 
 Todo: Put in the determinant check.
 
@@ -20,15 +22,16 @@ Todo: Put in the determinant check.
 """
 
 import numpy as np
-import matplotlib.pyplot as plt
+
+from glass_catalog import (expansion_coefficient, material_absorption,
+                           material_index, thermal_material_index)
 
 
 class OpticalRay:
     
     def __init__(self,y,u):
-        """ Define a ray for matrix optical calculations. 
-            Todo: make this construct a ray grid and think about the best structure
-            to store lots of rays (ex: millions)"""
+        """ Define a single ray for matrix optical calculations.  To store
+            lots of rays (ex: millions) use a RayBundle instead."""
             
         self.yu = np.zeros(shape = (2,1), dtype=float)
         self.yu[0] = y
@@ -37,6 +40,245 @@ class OpticalRay:
         
 
 
+class RayBundle:
+    """ Struct-of-arrays storage for large sets of rays.  Each attribute is a 
+    contiguous numpy array with one entry per ray, which keeps the memory per
+    ray at ~33 bytes and lets the bundle feed directly into propagate_rays.
+    
+    Parameters
+    ----------
+    y : float or array_like
+        Ray heights
+    u : float or array_like
+        Ray angles (radians, paraxial)
+    energy : float or array_like (optional)
+        Relative ray energy.  Default is 1.0
+    wavelength : float or array_like (optional)
+        Wavelength in microns.  Default is the d-line, 0.5876 um
+    alive : bool or array_like (optional)
+        False for rays that have been vignetted or otherwise terminated
+    """
+    
+    def __init__(self, y, u, energy=1.0, wavelength=0.5876, alive=True):
+        y, u, energy, wavelength, alive = np.broadcast_arrays(
+                y, u, energy, wavelength, alive)
+        num = y.size
+        
+        #heights and angles share one (rays,2) block, the layout propagation uses
+        self.yu = np.empty((num,2), dtype=float)
+        self.yu[:,0] = y.ravel()
+        self.yu[:,1] = u.ravel()
+        self.energy = np.array(energy, dtype=float).ravel()
+        self.wavelength = np.array(wavelength, dtype=float).ravel()
+        self.alive = np.array(alive, dtype=bool).ravel()
+        
+        
+    @classmethod
+    def from_yu(cls, yu, energy=1.0, wavelength=0.5876, alive=True):
+        """Build a bundle from an (rays,2) array of heights and angles."""
+        
+        yu = np.asarray(yu, dtype=float).reshape(-1,2)
+        return cls(yu[:,0], yu[:,1], energy, wavelength, alive)
+    
+    
+    @classmethod
+    def zeros(cls, num, wavelength=0.5876):
+        """Build a bundle of num on-axis rays with zero angle."""
+        
+        return cls(np.zeros(num), 0.0, wavelength=wavelength)
+    
+    
+    @classmethod
+    def fan(cls, ray_height, min_angle, max_angle, num, wavelength=0.5876):
+        """Build a ray fan of num angles from min_angle to max_angle, launched
+        from every height in ray_height (a float or array of heights).
+        """
+        
+        angles = np.linspace(min_angle, max_angle, num)
+        return cls.grid(ray_height, angles, wavelength)
+    
+    
+    @classmethod
+    def grid(cls, heights, angles, wavelength=0.5876):
+        """Build every combination of the given heights and angles, with the
+        angle varying fastest.  Returns len(heights)*len(angles) rays.
+        """
+        
+        heights = np.atleast_1d(np.asarray(heights, dtype=float))
+        angles = np.atleast_1d(np.asarray(angles, dtype=float))
+        return cls(heights[:,None], angles[None,:], wavelength=wavelength)
+    
+    
+    @classmethod
+    def from_pupil(cls, points, semi_aperture, field_angle=0.0, 
+                   wavelength=0.5876):
+        """Build rays from normalized 2D pupil samples (see ray_sampling).  
+        Matrix optics is meridional, so each sample launches a ray at height
+        semi_aperture*py with angle field_angle; px only weights the 
+        distribution of heights the way a full 2D pupil would.
+        """
+        
+        points = np.asarray(points, dtype=float).reshape(-1,2)
+        return cls(semi_aperture*points[:,1], field_angle, 
+                   wavelength=wavelength)
+    
+    
+    @classmethod
+    def from_rays(cls, rays):
+        """Build a bundle from a list of OpticalRay objects."""
+        
+        bundle = cls.zeros(len(rays))
+        for i, ray in enumerate(rays):
+            bundle.yu[i] = ray.yu[:,0]
+            bundle.energy[i] = ray.energy
+            
+        return bundle
+    
+    
+    @classmethod
+    def concatenate(cls, bundles):
+        """Join a sequence of bundles into a single new bundle."""
+        
+        new = cls.zeros(0)
+        new.yu = np.concatenate([b.yu for b in bundles])
+        new.energy = np.concatenate([b.energy for b in bundles])
+        new.wavelength = np.concatenate([b.wavelength for b in bundles])
+        new.alive = np.concatenate([b.alive for b in bundles])
+        
+        return new
+    
+    
+    @property
+    def y(self):
+        """Ray heights (view into yu)."""
+        return self.yu[:,0]
+    
+    
+    @property
+    def u(self):
+        """Ray angles (view into yu)."""
+        return self.yu[:,1]
+    
+    
+    @property
+    def nbytes(self):
+        """Total memory used by the ray arrays in bytes."""
+        return (self.yu.nbytes + self.energy.nbytes + self.wavelength.nbytes
+                + self.alive.nbytes)
+    
+    
+    def __len__(self):
+        return self.yu.shape[0]
+    
+    
+    def __getitem__(self, index):
+        """Select a subset of rays with a slice, index array or mask."""
+        
+        new = RayBundle.zeros(0)
+        new.yu = self.yu[index].reshape(-1,2)
+        new.energy = self.energy[index].ravel()
+        new.wavelength = self.wavelength[index].ravel()
+        new.alive = self.alive[index].ravel()
+        
+        return new
+    
+    
+    def add_rays(self, y, u, energy=1.0, wavelength=0.5876):
+        """Append one or more rays in place.  For bulk loads prefer building a
+        bundle with one of the constructors, since each call copies the arrays.
+        """
+        
+        new = RayBundle.concatenate([self, RayBundle(y, u, energy, wavelength)])
+        self.yu = new.yu
+        self.energy = new.energy
+        self.wavelength = new.wavelength
+        self.alive = new.alive
+        
+
+
+def pupil_ray_chunks(chunks, semi_aperture, field_angle=0.0, 
+                     wavelength=0.5876):
+    """Turn a stream of pupil sample chunks (ex: ray_sampling.iter_chunks) 
+    into a stream of RayBundles, one per chunk.
+    """
+    
+    for points in chunks:
+        yield RayBundle.from_pupil(points, semi_aperture, field_angle, 
+                                   wavelength)
+        
+
+
+class MatrixList(list):
+    """ List of transfer matricies that records direct edits, so an 
+    OpticalSystem can update its matrix cache without comparing every entry.
+    Assigning an entry (ex: system.matricies[1] = M) marks that index dirty,
+    appended entries are added to the end of the cache, and any other change
+    in length or order marks the whole list for a rebuild.  Edits inside an
+    entry (ex: system.matricies[1][0,1] = d) cannot be seen, so call 
+    OpticalSystem.invalidate_cache() after those.
+    """
+    
+    def __init__(self, matricies=()):
+        super().__init__(matricies)
+        self.dirty = set()
+        self.resized = False
+        
+        
+    def clear_changes(self):
+        self.dirty.clear()
+        self.resized = False
+        
+        
+    def __setitem__(self, index, M):
+        super().__setitem__(index, M)
+        if isinstance(index, slice):
+            self.resized = True
+        else:
+            self.dirty.add(index % len(self))
+            
+            
+    #appends just grow the list; other changes of length or order rebuild
+    def __delitem__(self, index):
+        self.resized = True
+        return super().__delitem__(index)
+        
+        
+    def __imul__(self, num):
+        self.resized = True
+        return super().__imul__(num)
+        
+        
+    def insert(self, index, M):
+        self.resized = True
+        return super().insert(index, M)
+        
+        
+    def pop(self, index=-1):
+        self.resized = True
+        return super().pop(index)
+        
+        
+    def remove(self, M):
+        self.resized = True
+        return super().remove(M)
+        
+        
+    def clear(self):
+        self.resized = True
+        return super().clear()
+        
+        
+    def sort(self, **kwargs):
+        self.resized = True
+        return super().sort(**kwargs)
+        
+        
+    def reverse(self):
+        self.resized = True
+        return super().reverse()
+    
+    
+
 class OpticalSystem:
     
     def __init__(self):
@@ -44,13 +286,16 @@ class OpticalSystem:
         system matricies
         """
         
-        #initialize rays - at least get an empty list started
-        self.start_rays = [] 
+        #initialize rays - an empty bundle, grown with add_ray or replaced
+        self.start_rays = RayBundle.zeros(0)
         self.locations = [0]  #new list of locations
         
         #start_rays.append(optical_ray(0,.1))   #chief and marginal rays
         #start_rays.append(optical_ray(.1,0))
         
+        #cached composite, prefix and range products of the matricies
+        self.matrix_cache = SystemMatrixCache()
+        
         #initialize and store system matricies list 
         self.matricies= []     
         
@@ -60,58 +305,708 @@ class OpticalSystem:
         
     def create_rayfan(self, ray_height, min_angle, max_angle, num):
         """ Create a rayfan with extents min_angle to max_angle, with num rays
-        Todo: Add loop for ray_heights too
+        per height.  ray_height can be a single height or an array of heights.
         """
           
-        for i in np.linspace(self, ray_height, min_angle, max_angle, num):  #make a ray fan
-            self.start_rays.append(OpticalRay(ray_height,i)) 
+        fan = RayBundle.fan(ray_height, min_angle, max_angle, num)
+        self.start_rays = RayBundle.concatenate([self.start_rays, fan])
 
 
     def add_chief_and_marginal_rays(self):
         # add chief and marginal rays
-        self.start_rays.append(OpticalRay(0,.1))   #need to know height of aperture
-        self.start_rays.append(OpticalRay(.1,0))   #need to know height of object   
+        #need to know height of aperture and height of object
+        self.start_rays.add_rays([0,.1], [.1,0])
         
         
     def add_ray(self,y,u):
         """ Add an arbitrary ray at height y and angle u
         """
-        self.start_rays.append(OpticalRay(y,u))
+        self.start_rays.add_rays(y,u)
+    
+    
+    @property
+    def matricies(self):
+        """The system matricies, a MatrixList.  Direct edits are picked up by
+        the next call that uses the cache."""
+        return self._matricies
     
     
+    @matricies.setter
+    def matricies(self, matricies):
+        self._matricies = MatrixList(matricies)
+        self._matricies.resized = True
+        
+        
     def append_matrix(self, M):
         """Append a matrix to the system.
         """
         
-        self.matricies.append(M)
+        self.sync_cache()
+        list.append(self._matricies, M)
+        self.matrix_cache.insert(len(self._matricies)-1, M)
+        
+        
+    def set_matrix(self, index, M):
+        """Replace the matrix at index.  Only the cached products that depend
+        on this element are recomputed.
+        """
+        
+        self.sync_cache()
+        list.__setitem__(self._matricies, index, M)
+        self.matrix_cache.set(index % len(self._matricies), M)
+        
+        
+    def insert_matrix(self, index, M):
+        """Insert a matrix before position index.
+        """
+        
+        self.sync_cache()
+        #same index clipping as list.insert
+        num = len(self._matricies)
+        index = min(max(index + num if index < 0 else index, 0), num)
+        list.insert(self._matricies, index, M)
+        self.matrix_cache.insert(index, M)
+        
+        
+    def remove_matrix(self, index):
+        """Remove the matrix at position index.
+        """
+        
+        self.sync_cache()
+        index = index % len(self._matricies)
+        list.__delitem__(self._matricies, index)
+        self.matrix_cache.remove(index)
+        
+        
+    def sync_cache(self):
+        """Bring the matrix cache up to date with direct edits of 
+        self.matricies (see MatrixList).  Only entries appended or assigned 
+        since the last sync are updated, and nothing is done when there were
+        no edits; any other change in length or order rebuilds the cache.
+        """
+        
+        mats = self._matricies
+        if mats.resized or self.matrix_cache.num > len(mats):
+            self.invalidate_cache()
+            return
+        for index in range(self.matrix_cache.num, len(mats)):
+            self.matrix_cache.insert(index, mats[index])
+        if len(mats.dirty) > self.matrix_cache.size//2:
+            self.invalidate_cache()
+            return
+        for index in mats.dirty:
+            self.matrix_cache.set(index, mats[index])
+        mats.clear_changes()
+            
+            
+    def invalidate_cache(self):
+        """Discard all cached products and rebuild from self.matricies.  Needed
+        only after editing the contents of an entry in place.
+        """
+        
+        self.matrix_cache.rebuild(self._matricies)
+        self._matricies.clear_changes()
+        
+        
+    def system_matrix(self):
+        """Composite ABCD matrix from the input plane to the output plane.
+        """
+        
+        self.sync_cache()
+        return self.matrix_cache.system_matrix()
         
      
     def update_system(self):
         """Progagate rays, recomputes entire system ray matrix
         """
         
-        self.ray_matrix = np.zeros((len(self.start_rays),len(self.matricies)+1,2))
-        #load starting rays:
-        count = 0  #need a counter if iterating through objects
-        for i in self.start_rays:
-            self.ray_matrix[count,0,0] = i.yu[0]
-            self.ray_matrix[count,0,1] = i.yu[1]
-            count +=1
+        #push the whole ray set through each matrix at once
+        self.sync_cache()
+        self.ray_matrix = apply_cumulative_matricies(
+                self.start_rays, self.matrix_cache.prefix_matricies())
+        
+        
+    def stream_system(self, chunks, surfaces=None, out_path=None, total=None):
+        """Propagate a stream of ray chunks through the system without building 
+        the full ray matrix.  See propagate_stream for the parameters.
+        """
         
-        #multiply by each matrix
-        for i in range(len(self.start_rays)):
-            for j in range(len(self.matricies)):
-                self.ray_matrix[i][j+1] = np.dot(self.matricies[j], self.ray_matrix[i][j])
+        self.sync_cache()
+        return propagate_stream(chunks, self.matrix_cache.prefix_matricies(),
+                                surfaces, out_path, total, cumulative=True)
         
             
 
+class SystemMatrixCache:
+    """ Cached products of a sequence of transfer matricies.
+    
+    The matricies are the leaves of a binary product tree, so the composite 
+    system matrix is available in O(1) and the product over any range of 
+    elements in O(log N).  Replacing one element updates only the log N nodes
+    above it.  The running (prefix) products used for ray propagation are
+    computed lazily and only from the first changed element onward.
+    
+    Inserting or removing an element rebuilds the tree level by level (log N
+    vectorized products).
+    """
+    
+    def __init__(self, matricies=()):
+        self.rebuild(matricies)
+        
+        
+    def rebuild(self, matricies):
+        """Recompute the whole cache from a sequence of 2x2 matricies."""
+        
+        mats = np.asarray(matricies, dtype=float).reshape(-1,2,2)
+        self.num = mats.shape[0]
+        
+        #leaves live at tree[size:size+num], padded with identities
+        self.size = 1
+        while self.size < self.num:
+            self.size *= 2
+        self.tree = np.empty((2*self.size,2,2))
+        self.tree[self.size:] = np.eye(2)
+        self.tree[self.size:self.size+self.num] = mats
+        
+        #each node is the product of its children, later element on the left
+        level = self.size//2
+        while level >= 1:
+            nodes = np.arange(level, 2*level)
+            np.matmul(self.tree[2*nodes+1], self.tree[2*nodes], 
+                      out=self.tree[level:2*level])
+            level //= 2
+            
+        #sized to the tree capacity so appends don't reallocate
+        self.prefix = np.empty((self.size+1,2,2))
+        self.prefix[0] = np.eye(2)
+        self.prefix_valid = 0  #prefix[:prefix_valid+1] is up to date
+        
+        
+    def leaves(self):
+        """The cached matricies as a (num,2,2) array."""
+        return self.tree[self.size:self.size+self.num]
+    
+    
+    def set(self, index, M):
+        """Replace the matrix at index, updating the nodes above it."""
+        
+        pos = self.size + index
+        self.tree[pos] = M
+        pos //= 2
+        while pos >= 1:
+            np.matmul(self.tree[2*pos+1], self.tree[2*pos], out=self.tree[pos])
+            pos //= 2
+            
+        self.prefix_valid = min(self.prefix_valid, index)
+        
+        
+    def insert(self, index, M):
+        """Insert a matrix before position index."""
+        
+        if index == self.num and self.num < self.size:
+            #room left in the tree, so appending is a single leaf update
+            self.num += 1
+            self.set(index, M)
+            return
+            
+        self._resize(np.insert(self.leaves(), index, M, axis=0), index)
+        
+        
+    def remove(self, index):
+        """Remove the matrix at position index."""
+        
+        self._resize(np.delete(self.leaves(), index, axis=0), index)
+        
+        
+    def _resize(self, mats, index):
+        #rebuild, keeping the still valid part of the prefix products
+        prefix = self.prefix
+        valid = min(self.prefix_valid, index)
+        self.rebuild(mats)
+        self.prefix[:valid+1] = prefix[:valid+1]
+        self.prefix_valid = valid
+        
+        
+    def system_matrix(self):
+        """Product of all matricies, mapping the input plane to the output."""
+        return self.tree[1].copy()
+    
+    
+    def range_matrix(self, start, stop):
+        """Product of the matricies start..stop-1, mapping plane start to 
+        plane stop.  Evaluated in O(log N) from the tree.
+        """
+        
+        left = np.eye(2)   #earlier elements
+        right = np.eye(2)  #later elements
+        lo = start + self.size
+        hi = stop + self.size
+        while lo < hi:
+            if lo & 1:
+                left = self.tree[lo] @ left
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                right = right @ self.tree[hi]
+            lo //= 2
+            hi //= 2
+            
+        return right @ left
+    
+    
+    def suffix_matrix(self, index):
+        """Product of the matricies from index to the end of the system."""
+        return self.range_matrix(index, self.num)
+    
+    
+    def prefix_matricies(self):
+        """Running products, shape (num+1,2,2).  Entry s maps the input plane
+        to plane s.  Only entries after the first changed element are redone.
+        """
+        
+        leaves = self.leaves()
+        for j in range(self.prefix_valid, self.num):
+            np.matmul(leaves[j], self.prefix[j], out=self.prefix[j+1])
+        self.prefix_valid = self.num
+        
+        return self.prefix[:self.num+1]
+    
+
+
+class DispersiveSystem:
+    """ An optical system whose elements are defined by material (a catalog 
+    glass name such as 'S-BSL7', 'air', or a constant index) rather than by
+    fixed indices, so it can be evaluated at any set of wavelengths.
+    
+    Every element is evaluated for all wavelengths at once, giving stacks of
+    matricies, and the indices of each material are computed once per 
+    wavelength grid (and memoized by glass_catalog).  Chromatic curves over
+    hundreds of wavelengths then come from one batched call.
+    
+    Temperature can be added as another batch axis: the glass indices follow
+    the catalog dn/dT model, glass thicknesses and surface radii grow with the
+    glass expansion coefficient, and air spaces with the housing expansion
+    coefficient, all from 20 C.  A thermal sweep is then one call too.
+    
+    Wavelengths are in microns and temperatures in C.
+    """
+    
+    def __init__(self):
+        self.elements = []   #(kind, parameters) in propagation order
+        
+        
+    def add_free_space(self, dist, material='air'):
+        """Propagate a distance through a material."""
+        self.elements.append(('space', (dist, material)))
+        
+        
+    def add_refraction(self, material1, material2, radius):
+        """Refract at a surface of the given radius between two materials."""
+        self.elements.append(('refract', (material1, material2, radius)))
+        
+        
+    def add_thin_lens(self, focal_length):
+        """Add a dispersion free thin lens."""
+        self.elements.append(('matrix', thin_lens_matrix(focal_length)))
+        
+        
+    def add_matrix(self, M):
+        """Add a fixed (wavelength independent) matrix."""
+        self.elements.append(('matrix', np.asarray(M, dtype=float)))
+        
+        
+    def add_singlet(self, R1, R2, thickness, glass, medium='air'):
+        """Add a thick singlet lens: two refractions and the glass between."""
+        
+        self.add_refraction(medium, glass, R1)
+        self.add_free_space(thickness, glass)
+        self.add_refraction(glass, medium, R2)
+        
+        
+    def matricies(self, wavelengths, temperatures=None, housing_cte=0.0):
+        """Element matricies at every wavelength, shape (elements, W, 2, 2),
+        or at every temperature and wavelength, shape (elements, T, W, 2, 2),
+        when temperatures are given.  housing_cte (1/K) scales the air spaces.
+        """
+        
+        wavelengths = np.atleast_1d(np.asarray(wavelengths, dtype=float))
+        batch = (wavelengths.size,)
+        if temperatures is not None:
+            temperatures = np.atleast_1d(np.asarray(temperatures, dtype=float))
+            batch = (temperatures.size,) + batch
+            dT = temperatures[:,None] - 20
+            
+        indices = {}
+        def n(material):
+            key = material if isinstance(material, str) else float(material)
+            if key not in indices:
+                if temperatures is None:
+                    indices[key] = material_index(material, wavelengths)
+                else:
+                    indices[key] = thermal_material_index(
+                        material, wavelengths, temperatures)
+            return indices[key]
+        
+        def scale(material):
+            #thermal growth of lengths in (or bounded by) a material
+            if temperatures is None:
+                return 1.0
+            return 1 + expansion_coefficient(material, housing_cte)*dT
+        
+        mats = np.empty((len(self.elements),) + batch + (2, 2))
+        for j, (kind, p) in enumerate(self.elements):
+            if kind == 'space':
+                mats[j] = xfer_free_space(p[0]*scale(p[1]), n(p[1]))
+            elif kind == 'refract':
+                #the radius belongs to the glass side of the surface
+                glass = p[1] if isinstance(p[1], str) and p[1] != 'air' else p[0]
+                mats[j] = refraction_matrix(n(p[0]), n(p[1]),
+                                            p[2]*scale(glass))
+            else:
+                mats[j] = p
+                
+        return mats
+    
+    
+    def cumulative_matricies(self, wavelengths, temperatures=None,
+                             housing_cte=0.0):
+        """Running products at every wavelength, shape (W, elements+1, 2, 2),
+        or (T, W, elements+1, 2, 2) when temperatures are given.
+        """
+        
+        mats = self.matricies(wavelengths, temperatures, housing_cte)
+        P = np.empty(mats.shape[1:-2] + (mats.shape[0]+1, 2, 2))
+        P[...,0,:,:] = np.eye(2)
+        for j in range(mats.shape[0]):
+            np.matmul(mats[j], P[...,j,:,:], out=P[...,j+1,:,:])
+            
+        return P
+    
+    
+    def system_matricies(self, wavelengths, temperatures=None,
+                         housing_cte=0.0):
+        """Composite system matrix at every wavelength, shape (W, 2, 2), or
+        (T, W, 2, 2) when temperatures are given."""
+        
+        P = self.cumulative_matricies(wavelengths, temperatures, housing_cte)
+        return P[...,-1,:,:]
+    
+    
+    def propagate(self, rays, wavelengths):
+        """Propagate rays at every wavelength.
+        
+        Parameters
+        ----------
+        rays : ndarray or RayBundle
+            Starting rays, shape (rays, 2)
+        wavelengths : array_like
+            Wavelengths in microns
+            
+        Returns
+        -------
+        ray_matrix : ndarray
+            Ray parameters at every plane, shape 
+            (wavelengths, rays, elements+1, 2)
+        """
+        
+        if isinstance(rays, RayBundle):
+            rays = rays.yu
+        yu = np.asarray(rays, dtype=float).reshape(-1,2)
+        P = self.cumulative_matricies(wavelengths)
+        W, S = P.shape[:2]
+        
+        #one batched product: (rays,2) @ (W, 2, 2*planes)
+        out = np.matmul(yu, P.transpose(0,3,1,2).reshape(W,2,2*S))
+        return out.reshape(W, yu.shape[0], S, 2)
+    
+    
+    def focal_shift(self, wavelengths, reference=0.5876):
+        """Chromatic focal shift: back focal distance (-A/C, from the last 
+        element) at each wavelength minus that at the reference wavelength.
+        Returns (efl, bfl, shift), each of shape (W,).
+        """
+        
+        wavelengths = np.atleast_1d(np.asarray(wavelengths, dtype=float))
+        M = self.system_matricies(np.append(wavelengths, reference))
+        efl = -1/M[:,1,0]
+        bfl = -M[:,0,0]/M[:,1,0]
+        
+        return efl[:-1], bfl[:-1], bfl[:-1] - bfl[-1]
+    
+    
+    def throughput(self, rays, wavelengths, fresnel=False, mm_per_unit=1.0):
+        """Energy of every ray at every plane and wavelength, from the
+        internal transmission of the glasses along each ray's path (and
+        optionally uncoated surface reflections).
+        
+        The ray energy (RayBundle.energy) is carried through the system in
+        one vectorized pass: the optical depth of each element is the glass
+        absorption coefficient times the ray path length d*sqrt(1 + theta**2)
+        (paraxial, theta = u/n), accumulated over the elements.
+        
+        Parameters
+        ----------
+        rays : ndarray or RayBundle
+            Starting rays, shape (rays, 2).  Plain arrays start with energy 1
+        wavelengths : array_like
+            Wavelengths in microns
+        fresnel : bool (optional)
+            Include normal incidence reflection losses ((n2-n1)/(n2+n1))**2
+            at every refraction.  Default is False
+        mm_per_unit : float (optional)
+            Length of one system distance unit in mm (the catalog
+            transmission is per mm).  Default is 1 (distances in mm)
+            
+        Returns
+        -------
+        energy : ndarray
+            Ray energy at every plane, shape (W, rays, elements+1); the last
+            plane is the system throughput of each ray
+        """
+        
+        wavelengths = np.atleast_1d(np.asarray(wavelengths, dtype=float))
+        energy = getattr(rays, 'energy', 1.0)
+        ray_matrix = self.propagate(rays, wavelengths)
+        W, R = ray_matrix.shape[:2]
+        E = len(self.elements)
+        
+        #per element absorption (1/mm), index and length, shape (E, W)
+        alpha = np.zeros((E, W))
+        n = np.ones((E, W))
+        dist = np.zeros((E, 1))
+        loss = np.zeros((E, W))
+        for j, (kind, p) in enumerate(self.elements):
+            if kind == 'space':
+                alpha[j] = material_absorption(p[1], wavelengths)
+                n[j] = material_index(p[1], wavelengths)
+                dist[j] = p[0]*mm_per_unit
+            elif kind == 'refract' and fresnel:
+                n1 = material_index(p[0], wavelengths)
+                n2 = material_index(p[1], wavelengths)
+                loss[j] = -np.log(1 - ((n2 - n1)/(n2 + n1))**2)
+        
+        #optical depth of every ray in every element, shape (W, R, E); only
+        #absorbing elements depend on the ray path
+        out = np.zeros((W, R, E+1))
+        depth = out[...,1:]
+        if fresnel:
+            depth += loss.T[:,None,:]
+        k = np.nonzero(alpha.any(axis=1) & (dist[:,0] != 0))[0]
+        if k.size:
+            theta = ray_matrix[...,k,1]/n[k].T[:,None,:]
+            depth[...,k] += (alpha[k]*dist[k]).T[:,None,:]*np.sqrt(1 + theta**2)
+        
+        np.cumsum(depth, axis=-1, out=depth)
+        np.negative(out, out=out)
+        np.exp(out, out=out)
+        out *= np.broadcast_to(energy, (R,))[:,None]
+        
+        return out
+    
+    
+    def thermal_focus_shift(self, temperatures, wavelengths=0.5876,
+                            reference=20.0, housing_cte=0.0):
+        """Thermal focus shift: back focal distance (-A/C, from the last
+        element) at each temperature minus that at the reference temperature,
+        for every wavelength, in one batched evaluation.
+        
+        Parameters
+        ----------
+        temperatures : array_like
+            Temperatures in C, shape (T,)
+        wavelengths : array_like (optional)
+            Wavelengths in microns, shape (W,).  Default is the d-line
+        reference : float (optional)
+            Reference temperature in C.  Default is 20
+        housing_cte : float (optional)
+            Expansion coefficient of the air spaces (1/K), ex: 23.6e-6 for an
+            aluminum housing.  Default is 0
+            
+        Returns
+        -------
+        efl, bfl, shift : ndarray
+            Each of shape (T, W)
+        """
+        
+        temperatures = np.atleast_1d(np.asarray(temperatures, dtype=float))
+        M = self.system_matricies(wavelengths,
+                                  np.append(temperatures, reference),
+                                  housing_cte)
+        efl = -1/M[...,1,0]
+        bfl = -M[...,0,0]/M[...,1,0]
+        
+        return efl[:-1], bfl[:-1], bfl[:-1] - bfl[-1]
+    
+    
+    def lateral_color(self, wavelengths, ray, reference=0.5876):
+        """Final ray height of a single (y, u) ray (ex: a chief ray) at each 
+        wavelength, minus its height at the reference wavelength.  Returns an
+        array of shape (W,).
+        """
+        
+        wavelengths = np.atleast_1d(np.asarray(wavelengths, dtype=float))
+        M = self.system_matricies(np.append(wavelengths, reference))
+        y = M[:,0,:] @ np.asarray(ray, dtype=float)
+        
+        return y[:-1] - y[-1]
+    
+    
+
+def propagate_rays(yu, matricies, out=None):
+    """Propagate a batch of rays through a sequence of transfer matricies.
+    
+    The cumulative products of the matricies are stacked into a single 
+    (2, 2*(surfaces+1)) array, so every ray is pushed to every plane with one
+    matrix product.  Runtime grows linearly with rays x surfaces.
+    
+    Parameters
+    ----------
+    yu : ndarray or RayBundle
+        Starting rays, shape (rays, 2) holding the height (y) and angle (u)
+    matricies : list or ndarray
+        Sequence of 2x2 transfer matricies, or a stacked (surfaces,2,2) array
+    out : ndarray (optional)
+        Preallocated C-contiguous output of shape (rays, surfaces+1, 2)
+        
+    Returns
+    -------
+    ray_matrix : ndarray
+        Ray parameters at every plane, shape (rays, surfaces+1, 2).  Index 0
+        along the second axis holds the starting rays.
+    """
+    
+    return apply_cumulative_matricies(yu, cumulative_matricies(matricies), out)
+
+
+def apply_cumulative_matricies(yu, P, out=None):
+    """Push rays through a stack of cumulative matricies P (shape 
+    (planes,2,2), see cumulative_matricies) with one matrix product.  Returns
+    an array of shape (rays, planes, 2).
+    """
+    
+    if isinstance(yu, RayBundle):
+        yu = yu.yu
+    yu = np.asarray(yu, dtype=float).reshape(-1,2)
+    if out is None:
+        out = np.empty((yu.shape[0], P.shape[0], 2))
+        
+    #out[r,s,i] = sum_j P[s,i,j] * yu[r,j]
+    np.matmul(yu, P.transpose(2,0,1).reshape(2,2*P.shape[0]), 
+              out=out.reshape(yu.shape[0],2*P.shape[0]))
+    
+    return out
+
+
+def propagate_stream(chunks, matricies, surfaces=None, out_path=None, 
+                     total=None, cumulative=False):
+    """Propagate rays chunk by chunk, yielding the result for each chunk.  Peak
+    memory is set by the chunk size and the number of kept surfaces, not by
+    the total number of rays, so ray sets larger than RAM can be traced.
+    
+    Parameters
+    ----------
+    chunks : iterable
+        Ray chunks, each a RayBundle or an (rays,2) array.  Any generator
+        works, ex: pupil_ray_chunks or ray_sampling.iter_chunks
+    matricies : list or ndarray
+        Sequence of 2x2 transfer matricies
+    surfaces : int, list or str (optional)
+        Plane indices to keep (0 is the input plane, -1 the final plane), or
+        'final' for the final plane only.  Default keeps all planes
+    out_path : str (optional)
+        If given, results are also written to a memory-mapped .npy file of 
+        shape (total, kept surfaces, 2)
+    total : int (optional)
+        Total number of rays in the stream.  Required with out_path, and the
+        stream must hold exactly this many rays (ValueError otherwise)
+    cumulative : bool (optional)
+        matricies already holds cumulative products (see 
+        cumulative_matricies).  Default is False
+        
+    Yields
+    ------
+    ray_matrix : ndarray
+        Results for one chunk, shape (chunk rays, kept surfaces, 2).  When 
+        writing to out_path this is a view into the memory-mapped file.
+    """
+    
+    P = np.asarray(matricies, dtype=float) if cumulative else \
+        cumulative_matricies(matricies)
+    if surfaces is None:
+        surfaces = np.arange(P.shape[0])
+    elif isinstance(surfaces, str) and surfaces == 'final':
+        surfaces = [-1]
+    P = np.ascontiguousarray(P[np.atleast_1d(surfaces)])
+    
+    out = None
+    if out_path is not None:
+        if total is None:
+            raise ValueError('total number of rays is needed to write to file')
+        out = np.lib.format.open_memmap(out_path, mode='w+', dtype=float,
+                                        shape=(total, P.shape[0], 2))
+    
+    count = 0
+    for chunk in chunks:
+        if isinstance(chunk, RayBundle):
+            chunk = chunk.yu
+        chunk = np.asarray(chunk, dtype=float).reshape(-1,2)
+        
+        if out is None:
+            yield apply_cumulative_matricies(chunk, P)
+        else:
+            if count + chunk.shape[0] > total:
+                raise ValueError('stream holds more than total rays')
+            block = out[count:count+chunk.shape[0]]
+            apply_cumulative_matricies(chunk, P, out=block)
+            yield block
+        count += chunk.shape[0]
+        
+    if out is not None:
+        out.flush()
+        if count != total:
+            #the rest of the file was never written
+            raise ValueError('stream ended after {} of {} rays'.format(
+                    count, total))
+        
+        
+def propagate_to_npy(chunks, matricies, out_path, total, surfaces='final'):
+    """Run propagate_stream to completion, writing every chunk to the .npy
+    file at out_path.  Returns the memory-mapped result array.
+    """
+    
+    for block in propagate_stream(chunks, matricies, surfaces, out_path, total):
+        pass
+        
+    return np.load(out_path, mmap_mode='r')
+        
+        
+def cumulative_matricies(matricies):
+    """Stack the running products of a sequence of transfer matricies.  
+    Entry s is the matrix taking a ray from the input plane to plane s, with
+    entry 0 the identity.  Returns an array of shape (surfaces+1, 2, 2).
+    """
+    
+    mats = np.asarray(matricies, dtype=float).reshape(-1,2,2)
+    P = np.empty((mats.shape[0]+1,2,2))
+    P[0] = np.eye(2)
+    for j in range(mats.shape[0]):
+        np.matmul(mats[j], P[j], out=P[j+1])
+        
+    return P
+
+
 def xfer_matrix(A,B,C,D):
-    """Define a transfer matrix
+    """Define a transfer matrix.  Scalar inputs give a 2x2 matrix; array 
+    inputs are broadcast against each other and give a stack of matricies of
+    shape (..., 2, 2), ex: one per configuration in a parameter sweep.
     """
     
-    matrix = np.zeros(shape=(2,2), dtype=float)
-    matrix[0] = [A,B]
-    matrix[1] = [C,D]
+    A, B, C, D = np.broadcast_arrays(A, B, C, D)
+    matrix = np.zeros(shape=A.shape + (2,2), dtype=float)
+    matrix[...,0,0] = A
+    matrix[...,0,1] = B
+    matrix[...,1,0] = C
+    matrix[...,1,1] = D
     
     return matrix
 
@@ -121,7 +1016,7 @@ def xfer_free_space(dist, n=1):
     index (n) are the input parameters.
     """
     
-    d = dist/n   #reduced distance
+    d = np.asarray(dist)/n   #reduced distance
     matrix = xfer_matrix(1,d,0,1)    
     return matrix
 
@@ -133,7 +1028,7 @@ def refraction_matrix(n1,n2,radius):
     
     A = 1
     B = 0
-    C = -(n2 - n1)/radius
+    C = -(np.asarray(n2) - n1)/radius
     D = 1
     matrix = xfer_matrix(A, B, C, D)    
     return matrix
@@ -146,7 +1041,7 @@ def thin_lens_matrix(focal_length):
     
     A = 1
     B = 0
-    C = -1/focal_length
+    C = -1/np.asarray(focal_length, dtype=float)
     D = 1
     matrix = xfer_matrix(A, B, C, D)    
     
@@ -156,22 +1051,12 @@ def thin_lens_matrix(focal_length):
 
 
 def plot_rays(ray_matx, loc):
+    """Plot ray heights vs. cumulative location (see plotting.plot_rays).
+    matplotlib is only imported when this is called.
+    """
     
-    #to plot, we need cumulative distances.  Maybe make part of array later
-    
-    plt.figure()
-    #draw optical axis
-    x = [np.min(loc), np.max(loc)]
-    y = [0,0]
-    plt.plot(x,y,'--')
-    
-    for i in range(ray_matx.shape[0]):
-        plt.plot(dist,ray_matx[i,:,0])     
-        
-    plt.title('Raytrace with Matrix Optics')
-    plt.xlabel('Distance (m)')
-    plt.ylabel('Ray height(m)')
-    plt.show()
+    from plotting import plot_rays
+    plot_rays(ray_matx, loc)
 
 
 #def append_element(ele):
@@ -3,17 +3,28 @@
 A module containing a number of functions used for performing common 
 optical calculations
 
+Only numpy is needed to import this module.  Plots live in plotting.py.
+
+All functions work like numpy ufuncs: inputs can be scalars or arrays of any
+broadcastable shapes, and an optional out= array receives the result without
+extra temporaries.  Functions that can meet elements with no valid result
+accept mask=True to also return a boolean array that is True where the
+result is valid.  What those elements hold depends on the function:
+
+    half_angle_from_NA       NaN where na > n
+    snells_law               NaN past the critical angle or outside +/-90 deg
+    sag_depth                NaN where h > R
+    fresnel_refl             Rs = Rp = 1.0 past the critical angle (TIR)
+    newton_wedge_fringe_sep  inf for a zero wedge angle
+
 """
 
 import numpy as np
-import matplotlib.pyplot as plt
-import scipy.constants as const
-import seaborn as sns
 
+from ufunc_utils import out_array, ufunc_result
 
-sns.set_style('whitegrid')
 
-def diff_limited_spot(wavelength, f,D):
+def diff_limited_spot(wavelength, f,D, out=None):
     """Compute the diffraction limited spot size achievable by a lens of 
     focal length f, wavelength lambda, and collimated input beam diameter D.
     Units must match, and will return same in units.
@@ -26,17 +37,23 @@ def diff_limited_spot(wavelength, f,D):
         The focal length of the lens      
     D: float
         The diameter of the collimated input beam        
+    out : ndarray (optional)
+        Array to store the result in
         
     Returns
     -------
     d: the diffraction limited spot size
     
     """  
-    d = (4*wavelength*f)/(np.pi*D)
-    return d
+    given = out is not None
+    d = out_array(out, wavelength, f, D)
+    np.multiply(wavelength, f, out=d)
+    d *= 4/np.pi
+    d /= D
+    return ufunc_result(d, given)
     
 
-def fnum(efl,diameter):
+def fnum(efl,diameter, out=None):
     """Compute the F-number from the efl and diameter.  Both have to be the 
     same units.
     
@@ -46,17 +63,21 @@ def fnum(efl,diameter):
         The focal length of the lens
     diameter : float
         The diameter of the input beam (in the same units as efl)
+    out : ndarray (optional)
+        Array to store the result in
         
     Returns
     -------
     fnum : float
         The fnumber of the system
     """
-    fnum = efl/diameter
-    return fnum
+    given = out is not None
+    fnum = out_array(out, efl, diameter)
+    np.divide(efl, diameter, out=fnum)
+    return ufunc_result(fnum, given)
     
     
-def half_angle_from_NA(na, n=1,deg=True):
+def half_angle_from_NA(na, n=1,deg=True, out=None, mask=False):
     """Compute the half angle of the cone of light from the NA value.  From
     the equation NA = n x sin(theta). 
     
@@ -68,6 +89,10 @@ def half_angle_from_NA(na, n=1,deg=True):
         The index of the material.  Default is 1.0 (air)
     deg : bool (optional)
         Return result in degrees or radians. Default is degrees.
+    out : ndarray (optional)
+        Array to store the result in
+    mask : bool (optional)
+        Also return a boolean array, False where na > n (theta is NaN)
         
     Returns
     -------
@@ -75,18 +100,23 @@ def half_angle_from_NA(na, n=1,deg=True):
         The half angle of the cone of light in degrees
         
     """
+    given = out is not None
+    theta = out_array(out, na, n)
+    np.divide(na, n, out=theta)
+    valid = np.abs(theta) <= 1
+    with np.errstate(invalid='ignore'):
+        np.arcsin(theta, out=theta)
     if deg==True:
-        theta = np.rad2deg(np.arcsin(na/n))
-    else:
-        theta = np.arcsin(na/n)
+        np.rad2deg(theta, out=theta)
         
-    return theta 
+    return ufunc_result(theta, given, valid, mask)
     
 
 
-def snells_law(n1,n2,theta1):
+def snells_law(n1,n2,theta1, out=None, mask=False):
     """Compute the refracted ray angle (theta2) from index1,index2, 
-        and angle in (theta1).  Angle must be in the range -90 to 90 deg  
+        and angle in (theta1).  Angle must be in the range -90 to 90 deg.
+        Past the critical angle (total internal reflection) the result is NaN.
     
     Parameters
     ----------
@@ -96,6 +126,11 @@ def snells_law(n1,n2,theta1):
         Index of the medium the ray is entering into.
     theta1 : float
         Incident ray angle (degrees) measured from normal to the surface        
+    out : ndarray (optional)
+        Array to store the result in
+    mask : bool (optional)
+        Also return a boolean array, False for total internal reflection or 
+        incident angles outside -90 to 90 deg
         
     Returns
     -------
@@ -104,29 +139,70 @@ def snells_law(n1,n2,theta1):
         measured from the surface normal.
     """
     
-    #need check for within -90 to 90 range, and handle it gracefully
-    theta1rad = np.deg2rad(theta1)
-    theta2rad = np.arcsin((n1/n2)*np.sin(theta1rad))
-    theta2 = np.rad2deg(theta2rad)
-    return theta2
+    given = out is not None
+    theta2 = out_array(out, n1, n2, theta1)
+    np.abs(theta1, out=theta2)
+    in_range = theta2 <= 90
+    np.deg2rad(theta1, out=theta2)
+    np.sin(theta2, out=theta2)
+    theta2 *= n1
+    theta2 /= n2
+    valid = np.abs(theta2) <= 1
+    valid &= in_range
+    with np.errstate(invalid='ignore'):
+        np.arcsin(theta2, out=theta2)
+    np.rad2deg(theta2, out=theta2)
+    theta2[~valid] = np.nan
+    return ufunc_result(theta2, given, valid, mask)
 
 
-def fresnel_refl(n1,n2,theta_i):
+def fresnel_refl(n1,n2,theta_i, out=None, mask=False):
     """ Compute the fresnel reflections at a dielectric surface with incident
     index n1, and entering index n2, with incident angle theta_i (in radians).  
-    Returns both the S and P polarized reflections. 
+    Returns both the S and P polarized reflections.  Past the critical angle
+    both are 1 (total internal reflection).
+    
+    out can be a tuple of two arrays (Rs, Rp) to store the results in.  With
+    mask=True a boolean array is also returned, False where the light is
+    totally internally reflected.
     """
-    sterm1 = n1 * np.cos(theta_i)
-    sterm2 = n2*np.sqrt(1 - ((n1/n2)*np.sin(theta_i))**2)
-    Rs = ((sterm1 - sterm2)/(sterm1 + sterm2))**2
+    given = out is not None
+    if out is None:
+        out = (out_array(None, n1, n2, theta_i), 
+               out_array(None, n1, n2, theta_i))
+    Rs, Rp = out
     
-    pterm1 = n2*np.cos(theta_i)
-    pterm2 = n1*np.sqrt(1 - ((n1/n2)*np.sin(theta_i))**2)
-    Rp = ((pterm2 - pterm1)/(pterm2 + pterm1))**2
+    #cos of the refracted angle, from snells law
+    cos_t = Rp
+    np.sin(theta_i, out=cos_t)
+    cos_t *= n1
+    cos_t /= n2
+    np.square(cos_t, out=cos_t)
+    np.subtract(1, cos_t, out=cos_t)
+    valid = cos_t >= 0
+    np.sqrt(np.maximum(cos_t, 0, out=cos_t), out=cos_t)
+    cos_i = np.cos(theta_i)
+    
+    #Rs = ((n1 cos_i - n2 cos_t)/(n1 cos_i + n2 cos_t))**2
+    sterm1 = n1*cos_i
+    sterm2 = np.multiply(n2, cos_t, out=Rs)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pterm = (n2*cos_i - n1*cos_t)/(n2*cos_i + n1*cos_t)
+        np.divide(sterm1 - sterm2, sterm1 + sterm2, out=Rs)
+    np.square(Rs, out=Rs)
+    
+    #Rp = ((n1 cos_t - n2 cos_i)/(n1 cos_t + n2 cos_i))**2
+    np.square(pterm, out=Rp)
     
     #tested with 0 deg incidence, correct at 4% Reflection
     #T = 1 - R
+    Rs[~valid] = 1.0
+    Rp[~valid] = 1.0
     
+    if not given and Rs.ndim == 0:
+        Rs, Rp, valid = Rs[()], Rp[()], valid[()]
+    if mask:
+        return Rs, Rp, valid
     return Rs,Rp
 
 
@@ -136,7 +212,11 @@ def braggs_law():
     pass
     
 
-def irradiance(power,diameter,units='mm'):
+#length units to cm, for irradiance
+_TO_CM = {'m': 100.0, 'cm': 1.0, 'mm': 0.1, 'um': 1e-4, 'nm': 1e-7}
+
+
+def irradiance(power,diameter,units='mm', out=None):
     """Compute the irradiance (power per unit area 'W/cm*2') on a surface.
     
     Parameters
@@ -146,7 +226,9 @@ def irradiance(power,diameter,units='mm'):
     diameter : float
         Spot size diameter in mm (default)
     units : String (optinal)
-        units, valid = m,mm,um,nm
+        units of diameter, valid = m,cm,mm,um,nm
+    out : ndarray (optional)
+        Array to store the result in
         
     Returns
     -------
@@ -154,34 +236,51 @@ def irradiance(power,diameter,units='mm'):
         The irradiance impinging on the surface in W/cm**2
     """
     
-    if units == 'mm':
-        d = .1*diameter
-        area = np.pi * d
+    if units not in _TO_CM:
+        raise ValueError('units must be one of {}'.format(', '.join(_TO_CM)))
         
-    irr = power/area
-    return irr
+    #area = pi*d**2/4, with d in cm
+    given = out is not None
+    irr = out_array(out, power, diameter)
+    np.multiply(diameter, _TO_CM[units], out=irr)
+    np.square(irr, out=irr)
+    irr *= np.pi/4
+    np.divide(power, irr, out=irr)
+    return ufunc_result(irr, given)
 
-def newton_wedge_fringe_sep(alpha, wavelength):
+def newton_wedge_fringe_sep(alpha, wavelength, out=None, mask=False):
     """Calculate the separation between fringes for an optical flat with angle
-    alpha."""
+    alpha.  A zero angle gives inf separation (mask is False there)."""
     
-    d = wavelength/(2*np.sin(alpha))
-    return d
+    given = out is not None
+    d = out_array(out, alpha, wavelength)
+    np.sin(alpha, out=d)
+    d *= 2
+    valid = d != 0
+    with np.errstate(divide='ignore'):
+        np.divide(wavelength, d, out=d)
+    return ufunc_result(d, given, valid, mask)
 
 
-def sag_depth(R,h):
-    """ Calculate sag depth of a shphere at height h.  """
+def sag_depth(R,h, out=None, mask=False):
+    """ Calculate sag depth of a shphere at height h.  Heights larger than the
+    radius give NaN (mask is False there).  """
     
-    if np.abs(h) > np.abs(R):
-        print('height must be less than the raduis')
-        return
-    else:
-        theta = np.arcsin(h/R)
-        sag = R*(1-np.cos(theta))
+    #sag = R*(1 - cos(arcsin(h/R))) = R*(1 - sqrt(1 - (h/R)**2))
+    given = out is not None
+    sag = out_array(out, R, h)
+    np.divide(h, R, out=sag)
+    np.square(sag, out=sag)
+    valid = sag <= 1
+    np.subtract(1, sag, out=sag)
+    with np.errstate(invalid='ignore'):
+        np.sqrt(sag, out=sag)
+    np.subtract(1, sag, out=sag)
+    sag *= R
         
-    return sag
+    return ufunc_result(sag, given, valid, mask)
 
-def abbe_number(nd, nF, nC):
+def abbe_number(nd, nF, nC, out=None):
     """ Compute the Abbe number (reciprocal dispersion).  Using the visible F, 
     d, and C lines:
         F(H):  486.1 nm
@@ -190,11 +289,16 @@ def abbe_number(nd, nF, nC):
         
     nd, nF, and nC are the refractive indicies at each of these three lines.
     
-    Todo: Alternately, select a glass type and compute these three n's.
+    To compute V for catalog glasses by name (or for the whole catalog at
+    once) see glass_catalog.GlassCatalog.abbe_numbers.
     
+    out can be an array to store the result in.
     """
-    V = (nd - 1)/(nF - nC)
-    return V
+    given = out is not None
+    V = out_array(out, nd, nF, nC)
+    np.subtract(nF, nC, out=V)
+    np.divide(np.subtract(nd, 1), V, out=V)
+    return ufunc_result(V, given)
 
 
 
@@ -203,15 +307,5 @@ if __name__ == "__main__":
     #test some functions here
     
     #test fresnel
-    theta = np.linspace(0,np.pi/2,100)
-    Rs,Rp = fresnel_refl(1,1.5,theta)
-    
-    plt.figure()
-    plt.plot(np.rad2deg(theta),Rs, label = 'Rs')
-    plt.plot(np.rad2deg(theta),Rp, label = 'Rp')
-    plt.title('Fresenel Reflection vs. Angle of incidence')
-    plt.xlabel('Angle (deg)')
-    plt.ylabel('Reflection')
-    plt.legend()
-    plt.show()                                       
-    
\ No newline at end of file
+    from plotting import plot_fresnel
+    plot_fresnel(1,1.5)
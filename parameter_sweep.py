@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Parameter sweeps over matrix optics systems.
+
+Instead of rebuilding an OpticalSystem for every configuration, a sweep 
+evaluates all configurations at once as stacks of (K,2,2) matricies.  The 
+element functions in matrix_optics (xfer_free_space, thin_lens_matrix, 
+refraction_matrix) accept arrays, so a system builder written for a single
+configuration works unchanged on arrays of K parameter values.
+
+Example: two thin lenses with a variable spacing and focal length
+
+    def doublet(f1, d, f2):
+        return [thin_lens_matrix(f1), xfer_free_space(d), thin_lens_matrix(f2)]
+        
+    grid = parameter_grid(f1=np.linspace(50,100,200), d=np.linspace(0,20,100),
+                          f2=[-75,-100])
+    result = sweep(doublet, grid, rays=[[5,0]])
+
+Very large grids are split into chunks that can be spread over a process pool
+(the builder must then be a module level function).  Results always come back
+in grid order.
+
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+
+
+def parameter_grid(**axes):
+    """Full cartesian grid of the parameter values passed as keyword arrays.
+    The last parameter varies fastest.  Returns a dict of flattened arrays,
+    all of length K = product of the axis lengths.
+    """
+    
+    names = list(axes)
+    values = [np.atleast_1d(np.asarray(axes[n], dtype=float)) for n in names]
+    mesh = np.meshgrid(*values, indexing='ij')
+    
+    return {n: m.ravel() for n, m in zip(names, mesh)}
+
+
+def system_matricies(elements, num):
+    """Multiply a list of element matricies into the composite system matrix
+    for each configuration.  Elements may be single (2,2) matricies or (num,2,2)
+    stacks.  Returns an array of shape (num,2,2).
+    """
+    
+    M = np.broadcast_to(np.eye(2), (num,2,2)).copy()
+    for element in elements:
+        M = np.matmul(element, M)
+    
+    return M
+
+
+def system_metrics(M, rays=None):
+    """First order properties of a stack of system matricies.
+    
+    Parameters
+    ----------
+    M : ndarray
+        System matricies, shape (K,2,2)
+    rays : ndarray (optional)
+        Input rays, shape (rays,2) of height and angle
+        
+    Returns
+    -------
+    result : ndarray
+        Structured array of length K with fields 'efl' (-1/C), 'bfl' (-A/C,
+        measured from the last element), 'magnification' (A, the transverse
+        magnification when the system runs between conjugate planes), and 
+        'final_y' (output ray heights, shape (rays,)) when rays are given.
+        Afocal configurations get infinite efl and bfl.
+    """
+    
+    A = M[:,0,0]
+    C = M[:,1,0]
+    
+    fields = [('efl', float), ('bfl', float), ('magnification', float)]
+    if rays is not None:
+        rays = np.asarray(rays, dtype=float).reshape(-1,2)
+        fields.append(('final_y', float, (rays.shape[0],)))
+    result = np.empty(M.shape[0], dtype=fields)
+    
+    with np.errstate(divide='ignore'):
+        result['efl'] = -1/C
+        result['bfl'] = -A/C
+    result['magnification'] = A
+    if rays is not None:
+        #y' = A*y + B*u for every configuration and ray
+        result['final_y'] = M[:,0,:] @ rays.T
+        
+    return result
+
+
+def _evaluate(build, params, rays):
+    #evaluate one chunk of configurations (runs in the worker processes)
+    num = len(next(iter(params.values())))
+    M = system_matricies(build(**params), num)
+    metrics = system_metrics(M, rays)
+    
+    fields = [(n, float) for n in params] + metrics.dtype.descr
+    result = np.empty(num, dtype=fields)
+    for n in params:
+        result[n] = params[n]
+    for n in metrics.dtype.names:
+        result[n] = metrics[n]
+        
+    return result
+
+
+def sweep(build, params, rays=None, processes=None, chunk_size=100000):
+    """Evaluate a matrix optics system over many parameter configurations.
+    
+    Parameters
+    ----------
+    build : function
+        Takes the parameters as keyword arrays of length K and returns the 
+        list of element matricies, in propagation order
+    params : dict
+        Parameter name -> 1D array of values, all of the same length K.  Use 
+        parameter_grid to build a full grid
+    rays : ndarray (optional)
+        Input rays, shape (rays,2), whose final heights are reported
+    processes : int (optional)
+        Number of worker processes.  Default None evaluates in this process
+    chunk_size : int (optional)
+        Configurations evaluated per vectorized call (and per worker task)
+        
+    Returns
+    -------
+    result : ndarray
+        Structured array of length K with one field per parameter plus the 
+        fields from system_metrics, in the same order as params
+    """
+    
+    params = {n: np.atleast_1d(np.asarray(v, dtype=float)) 
+              for n, v in params.items()}
+    num = len(next(iter(params.values())))
+    chunks = [{n: v[i:i+chunk_size] for n, v in params.items()} 
+              for i in range(0, num, chunk_size)]
+    
+    if processes is not None and len(chunks) > 1:
+        #executor.map returns results in submission order
+        with ProcessPoolExecutor(processes) as executor:
+            parts = list(executor.map(_evaluate, repeat(build), chunks, 
+                                      repeat(rays)))
+    else:
+        parts = [_evaluate(build, c, rays) for c in chunks]
+        
+    return np.concatenate(parts)
+
+
+def to_dataframe(result):
+    """Convert a sweep result to a pandas DataFrame (one column per field,
+    final_y expanded to final_y0, final_y1, ...).  Requires pandas.
+    """
+    
+    import pandas as pd
+    
+    columns = {}
+    for n in result.dtype.names:
+        if result[n].ndim > 1:
+            for j in range(result[n].shape[1]):
+                columns[n + str(j)] = result[n][:,j]
+        else:
+            columns[n] = result[n]
+            
+    return pd.DataFrame(columns)
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Plotting functions for the optics modules.
+
+Kept separate so the numeric modules (optical_calcs, first_order_optics,
+matrix_optics, zernike, ...) import with only numpy and never need matplotlib
+or a display backend.  matplotlib (and seaborn, if installed) are imported
+here on first use.
+
+"""
+
+import numpy as np
+
+
+def _pyplot():
+    """Import pyplot on first use, with the seaborn whitegrid style when
+    seaborn is available."""
+
+    import matplotlib.pyplot as plt
+    try:
+        import seaborn as sns
+        sns.set_style('whitegrid')
+    except ImportError:
+        pass
+
+    return plt
+
+
+def plot_rays(ray_matx, loc):
+    """Plot ray heights from a matrix_optics ray matrix (rays, planes, 2)
+    against the cumulative plane locations loc.
+    """
+
+    plt = _pyplot()
+    plt.figure()
+    #draw optical axis
+    x = [np.min(loc), np.max(loc)]
+    y = [0,0]
+    plt.plot(x,y,'--')
+
+    for i in range(ray_matx.shape[0]):
+        plt.plot(loc,ray_matx[i,:,0])
+
+    plt.title('Raytrace with Matrix Optics')
+    plt.xlabel('Distance (m)')
+    plt.ylabel('Ray height(m)')
+    plt.show()
+
+
+def plot_fresnel(n1=1.0, n2=1.5, num=100):
+    """Plot the S and P fresnel reflections vs. angle of incidence."""
+
+    from optical_calcs import fresnel_refl
+
+    plt = _pyplot()
+    theta = np.linspace(0,np.pi/2,num)
+    Rs,Rp = fresnel_refl(n1,n2,theta)
+
+    plt.figure()
+    plt.plot(np.rad2deg(theta),Rs, label = 'Rs')
+    plt.plot(np.rad2deg(theta),Rp, label = 'Rp')
+    plt.title('Fresenel Reflection vs. Angle of incidence')
+    plt.xlabel('Angle (deg)')
+    plt.ylabel('Reflection')
+    plt.legend()
+    plt.show()
+
+
+def plot_zernike(osa_index):
+    """3D surface plot of a zernike polynomial (OSA/ANSI index) over the
+    unit pupil.
+
+    3D ploting based on matplotlib example by Armin Moser:
+    surface3d_radial_demo.py
+    """
+
+    from zernike import zernike_basis, zernike_label
+
+    plt = _pyplot()
+    from mpl_toolkits.mplot3d import Axes3D  # noqa: F401 (registers 3d)
+
+    # Create the mesh in polar coordinates and compute corresponding Z.
+    r = np.linspace(0, 1.25, 100)
+    theta = np.linspace(0, 2*np.pi, 100)
+    R, Theta = np.meshgrid(r, theta)
+
+    fig = plt.figure()
+    ax = fig.add_subplot(111, projection='3d')
+    Z = zernike_basis(osa_index, R, Theta, cache=False).reshape(R.shape)
+
+    # Express the mesh in the cartesian system.
+    X, Y = R*np.cos(Theta), R*np.sin(Theta)
+
+    plt.title(zernike_label(osa_index))
+    ax.plot_surface(X, Y, Z, cmap=plt.cm.jet)
+    ax.set_zlim(-2*np.pi, 2*np.pi)
+
+    plt.show()
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+Point spread function, MTF and Strehl ratio from pupil wavefronts by FFT.
+
+The pupil (npupil samples across the diameter) is zero padded to a size x size
+grid, and the PSF is |FFT(A*exp(2*pi*i*W))|**2 for amplitude A and wavefront
+W in waves.  The padding sets the image sampling:
+
+    Q = size/npupil          (samples per lambda*F#, Q >= 2 is Nyquist)
+
+so PSF pixels are lambda*F#/Q wide, and MTF pixels are 1/npupil of the
+incoherent cutoff frequency 1/(lambda*F#).
+
+PSFs are normalized to the peak of the unaberrated PSF of the same pupil, so
+the Strehl ratio is simply the PSF maximum.  The MTF is |FFT(PSF)|,
+normalized to one at zero frequency.
+
+The pupil is multiplied by a (-1)**(i+j) checkerboard so the PSF comes out
+centered without an fftshift.  Complex buffers of shape (chunk_size, size,
+size) are allocated once per calculator and reused, and the FFTs run in
+place.  numpy's FFT keeps its own plan cache per transform length, so a
+calculator of fixed size reuses the same plans on every call.  single=True
+keeps the buffers and results in complex64/float32, halving memory for large
+grids.
+
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+from wavefront_expansion import wavefront_polar
+from zernike import zernike_basis
+
+
+class PSFCalculator:
+    """ FFT PSF and MTF over a fixed pupil sampling.
+
+    Parameters
+    ----------
+    npupil : int (optional)
+        Samples across the pupil diameter.  Default is 128
+    sampling : float (optional)
+        Image samples per lambda*F# (padding factor).  Default is 2
+    size : int (optional)
+        Padded grid size, overrides sampling.  Rounded up to even
+    obscuration : float (optional)
+        Central obscuration as a fraction of the pupil radius.  Default is 0
+    mask : array_like (optional)
+        Extra (npupil, npupil) boolean pupil mask, ex: spider vanes
+    single : bool (optional)
+        Use complex64/float32 buffers and results.  Default is False
+    chunk_size : int (optional)
+        Wavefronts transformed at once (buffer depth).  Default is 8
+    """
+
+    def __init__(self, npupil=128, sampling=2.0, size=None, obscuration=0.0,
+                 mask=None, single=False, chunk_size=8):
+        if size is None:
+            size = int(np.ceil(npupil*sampling))
+        size += size % 2
+        if size < npupil:
+            raise ValueError('size must be at least npupil')
+
+        self.npupil = npupil
+        self.size = size
+        self.sampling = size/npupil
+        self.chunk_size = chunk_size
+        self.real = np.float32 if single else np.float64
+        self.complex = np.complex64 if single else np.complex128
+
+        #pupil sample centers across [-1, 1]
+        x = (np.arange(npupil) - (npupil - 1)/2)*(2/npupil)
+        X, Y = np.meshgrid(x, x)
+        rho = np.hypot(X, Y)
+        valid = (rho <= 1) & (rho >= obscuration)
+        if mask is not None:
+            valid &= np.asarray(mask, dtype=bool)
+
+        self.iy, self.ix = np.nonzero(valid)
+        self.rho = rho[self.iy, self.ix]
+        self.theta = np.arctan2(Y, X)[self.iy, self.ix]
+
+        #checkerboard centers the PSF; normalize to the unaberrated peak
+        sign = 1 - 2*((self.iy + self.ix) % 2)
+        self.amplitude = (sign/self.iy.size).astype(self.real)
+        i = np.arange(size)
+        self._checker = (1 - 2*((i[:,None] + i[None]) % 2)).astype(self.real)
+        self._buffer = None
+
+
+    @property
+    def num_points(self):
+        """Number of samples inside the pupil."""
+        return self.iy.size
+
+
+    def psf_coordinates(self):
+        """Image coordinates of the PSF pixels in units of lambda*F#, shape
+        (size,), zero at index size//2."""
+
+        return (np.arange(self.size) - self.size//2)/self.sampling
+
+
+    def frequencies(self):
+        """Spatial frequencies of the MTF pixels in units of the cutoff
+        1/(lambda*F#), shape (size,), zero at index size//2."""
+
+        return (np.arange(self.size) - self.size//2)/self.npupil
+
+
+    def _buffers(self, count):
+        if self._buffer is None or self._buffer.shape[0] < count:
+            self._buffer = np.empty((count, self.size, self.size),
+                                    dtype=self.complex)
+        return self._buffer[:count]
+
+
+    def _pupil_waves(self, wavefront, wavelengths):
+        """Wavefronts in waves at the pupil samples, shape (..., points)."""
+
+        w = np.asarray(wavefront)
+        n = self.npupil
+        if w.shape[-2:] == (n, n):
+            w = w[..., self.iy, self.ix]
+        elif w.shape[-1] != self.num_points:
+            raise ValueError('wavefronts need ({0}, {0}) maps or {1} pupil '
+                             'points'.format(n, self.num_points))
+
+        if wavelengths is not None:
+            wl = np.atleast_1d(np.asarray(wavelengths, dtype=float))
+            w = w[...,None,:]/wl[:,None]
+
+        return w
+
+
+    def zernike_wavefront(self, coefficients, indices, ordering='osa',
+                          normalize=None):
+        """Wavefront at the pupil samples from Zernike coefficients, shape
+        (..., points) for coefficients (..., terms).  The basis (normalized
+        as in zernike.zernike_basis) is cached there."""
+
+        basis = zernike_basis(indices, self.rho, self.theta, ordering,
+                              normalize=normalize)
+        return np.asarray(coefficients, dtype=float) @ basis
+
+
+    def seidel_wavefront(self, terms, H):
+        """Wavefront at the pupil samples from W_ijk coefficients (see
+        wavefront_expansion), shape (fields, points) for field heights H."""
+
+        return wavefront_polar(terms, H, self.rho, self.theta)
+
+
+    def psf(self, wavefront, wavelengths=None, mtf=False):
+        """PSF (and MTF) of a batch of wavefronts.
+
+        Parameters
+        ----------
+        wavefront : array_like
+            Wavefronts of shape (..., npupil, npupil), or (..., points) at
+            the pupil samples, ex: from zernike_wavefront or
+            seidel_wavefront.  In waves, or in the units of wavelengths when
+            given
+        wavelengths : array_like (optional)
+            Wavelengths of shape (W,); each wavefront is evaluated at each
+            wavelength, adding a W axis before the image axes
+        mtf : bool (optional)
+            Also compute the MTF.  Default is False
+
+        Returns
+        -------
+        psf : ndarray
+            PSF normalized to the unaberrated peak, shape (..., size, size)
+        mtf : ndarray
+            Only if mtf is True.  MTF, same shape
+        strehl : ndarray
+            Strehl ratio (PSF peak), shape (...)
+        """
+
+        w = self._pupil_waves(wavefront, wavelengths)
+        batch = w.shape[:-1]
+        w = w.reshape(-1, w.shape[-1])
+        count = w.shape[0]
+        image = (self.size, self.size)
+
+        psf = np.empty((count,) + image, dtype=self.real)
+        out_mtf = np.empty((count,) + image, dtype=self.real) if mtf else None
+        center = self.size//2
+
+        for start in range(0, count, self.chunk_size):
+            s = slice(start, min(start + self.chunk_size, count))
+            buf = self._buffers(s.stop - s.start)
+
+            phase = (2*np.pi)*w[s].astype(self.real, copy=False)
+            buf.fill(0)
+            buf[:, self.iy, self.ix] = self.amplitude*np.exp(1j*phase)
+            np.fft.fft2(buf, out=buf)
+            np.abs(buf, out=psf[s])
+            psf[s] **= 2
+
+            if mtf:
+                np.multiply(psf[s], self._checker, out=buf)
+                np.fft.fft2(buf, out=buf)
+                np.abs(buf, out=out_mtf[s])
+                out_mtf[s] /= out_mtf[s, center, center][:,None,None]
+
+        strehl = psf.reshape(count, -1).max(axis=1).reshape(batch)
+        psf = psf.reshape(batch + image)
+        if mtf:
+            return psf, out_mtf.reshape(batch + image), strehl
+        return psf, strehl
+
+
+    def zernike_psf(self, coefficients, indices, wavelengths=None,
+                    ordering='osa', mtf=False, normalize=None):
+        """PSF (and MTF) from Zernike coefficients of shape (..., terms), ex:
+        (fields, terms).  See psf for the returned values."""
+
+        return self.psf(self.zernike_wavefront(coefficients, indices,
+                                                ordering, normalize),
+                        wavelengths, mtf)
+
+
+@lru_cache(maxsize=4)
+def psf_calculator(npupil=128, sampling=2.0, size=None, obscuration=0.0,
+                   single=False):
+    """Shared PSFCalculator (and its buffers) for a pupil sampling."""
+
+    return PSFCalculator(npupil, sampling, size, obscuration, single=single)
+
+
+def zernike_psf(coefficients, indices, wavelengths=None, npupil=128,
+                sampling=2.0, obscuration=0.0, ordering='osa', mtf=False,
+                single=False, normalize=None):
+    """PSF (and MTF) of Zernike wavefronts with a shared calculator, see
+    PSFCalculator.psf.  Coefficients are in waves, or in the units of
+    wavelengths when given."""
+
+    calc = psf_calculator(npupil, sampling, None, obscuration, single)
+    return calc.zernike_psf(coefficients, indices, wavelengths, ordering, mtf,
+                            normalize)
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+Pupil and ray sampling patterns: linear fans, rectangular grids, hexapolar and
+polar rings, and low discrepancy (Halton, Sobol) sequences.
+
+Every sampler is index addressable.  Calling it with start/stop returns only
+the points start..stop-1 of the full pattern, so a pattern with millions of
+points can be produced in one call, or streamed in fixed size chunks with
+iter_chunks without ever holding the whole set in memory.
+
+2D samplers return arrays of shape (points, 2) in normalized pupil
+coordinates (x, y).
+
+"""
+
+import numpy as np
+
+
+def _index_range(num, start, stop):
+    """Clip a start/stop request to a pattern of num points."""
+
+    if stop is None or stop > num:
+        stop = num
+    start = min(max(start, 0), stop)
+    return np.arange(start, stop)
+
+
+def linear_fan(num, lo=-1.0, hi=1.0, start=0, stop=None):
+    """Evenly spaced values from lo to hi (inclusive), same as
+    np.linspace(lo, hi, num) but addressable by index range.
+
+    Parameters
+    ----------
+    num : int
+        Number of values in the full fan
+    lo : float (optional)
+        First value.  Default is -1
+    hi : float (optional)
+        Last value.  Default is 1
+    start, stop : int (optional)
+        Index range of the values to return
+
+    Returns
+    -------
+    values : ndarray
+        1D array of the requested fan values
+    """
+
+    i = _index_range(num, start, stop)
+    if num == 1:
+        return np.full(i.shape, float(lo))
+    return lo + (hi - lo)*i/(num - 1)
+
+
+def rectangular_grid(nx, ny, start=0, stop=None, circular=False):
+    """Rectangular grid of nx by ny points over the square [-1,1] x [-1,1].
+    Points are ordered with x varying fastest.
+
+    Parameters
+    ----------
+    nx, ny : int
+        Number of points along x and y
+    start, stop : int (optional)
+        Index range (into the full nx*ny grid) of the points to return
+    circular : bool (optional)
+        Drop points outside the unit circle.  Chunks then hold fewer than
+        stop-start points.  Default is False
+
+    Returns
+    -------
+    points : ndarray
+        Array of shape (points, 2)
+    """
+
+    i = _index_range(nx*ny, start, stop)
+    points = np.empty((i.size, 2))
+    points[:,0] = linear_fan(nx)[i % nx] if nx > 1 else 0.0
+    points[:,1] = linear_fan(ny)[i // nx] if ny > 1 else 0.0
+
+    if circular:
+        points = points[np.einsum('ij,ij->i', points, points) <= 1.0]
+
+    return points
+
+
+def hexapolar_count(rings):
+    """Number of points in a hexapolar pattern with the given ring count."""
+    return 1 + 3*rings*(rings + 1)
+
+
+def hexapolar(rings, start=0, stop=None):
+    """Hexapolar sampling of the unit circle.  Ring k (k = 1..rings) sits at
+    radius k/rings and holds 6k evenly spaced points, plus one point at the
+    center, for 1 + 3*rings*(rings+1) points in total.
+
+    Parameters
+    ----------
+    rings : int
+        Number of rings outside the center point
+    start, stop : int (optional)
+        Index range of the points to return
+
+    Returns
+    -------
+    points : ndarray
+        Array of shape (points, 2)
+    """
+
+    i = _index_range(hexapolar_count(rings), start, stop)
+
+    #ring k starts at index 1 + 3k(k-1); invert that for every index at once
+    k = np.floor((3 + np.sqrt(np.maximum(12*i - 3, 0)))/6).astype(int)
+    k[i == 0] = 0
+    #guard against rounding in the sqrt at ring boundaries
+    k[(k > 0) & (1 + 3*k*(k - 1) > i)] -= 1
+    first = np.where(k > 0, 1 + 3*k*(k - 1), 0)
+    j = i - first
+
+    r = k/rings if rings > 0 else np.zeros(i.shape)
+    theta = 2*np.pi*j/np.maximum(6*k, 1)
+
+    points = np.empty((i.size, 2))
+    points[:,0] = r*np.cos(theta)
+    points[:,1] = r*np.sin(theta)
+    return points
+
+
+def polar_rings(rings, per_ring, start=0, stop=None):
+    """Rings of equally many points on the unit circle.  Ring k (k = 1..rings)
+    sits at radius k/rings and holds per_ring points at angles 2*pi*j/per_ring,
+    for rings*per_ring points in total.
+
+    Parameters
+    ----------
+    rings : int
+        Number of rings
+    per_ring : int
+        Points on each ring
+    start, stop : int (optional)
+        Index range of the points to return
+
+    Returns
+    -------
+    points : ndarray
+        Array of shape (points, 2)
+    """
+
+    i = _index_range(rings*per_ring, start, stop)
+    r = (i//per_ring + 1)/rings
+    theta = 2*np.pi*(i % per_ring)/per_ring
+
+    points = np.empty((i.size, 2))
+    points[:,0] = r*np.cos(theta)
+    points[:,1] = r*np.sin(theta)
+    return points
+
+
+_PRIMES = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37]
+
+
+def radical_inverse(i, base):
+    """Van der Corput radical inverse of integer array i in the given base."""
+
+    i = np.array(i, dtype=np.int64)
+    result = np.zeros(i.shape)
+    digit = np.empty_like(i)
+    scale = 1.0/base
+    largest = int(i.max()) if i.size else 0
+    while largest > 0:
+        np.divmod(i, base, out=(i, digit))
+        result += digit*scale
+        largest //= base
+        scale /= base
+
+    return result
+
+
+def halton(num, dim=2, start=0, stop=None, skip=1):
+    """Halton low discrepancy sequence in the unit hypercube [0,1)^dim, using
+    the first dim primes as bases.
+
+    Parameters
+    ----------
+    num : int
+        Number of points in the full sequence
+    dim : int (optional)
+        Dimension of each point (up to 12).  Default is 2
+    start, stop : int (optional)
+        Index range of the points to return
+    skip : int (optional)
+        Number of leading sequence terms to drop.  Default is 1 (drops the
+        point at the origin)
+
+    Returns
+    -------
+    points : ndarray
+        Array of shape (points, dim)
+    """
+
+    i = _index_range(num, start, stop) + skip
+    points = np.empty((i.size, dim))
+    for d in range(dim):
+        points[:,d] = radical_inverse(i, _PRIMES[d])
+
+    return points
+
+
+def sobol(num, dim=2, start=0, stop=None, seed=None):
+    """Sobol low discrepancy sequence in the unit hypercube [0,1)^dim.
+    Requires scipy (scipy.stats.qmc).  Pass the same seed for every chunk of
+    a scrambled sequence, or seed=None for the unscrambled sequence.
+
+    Parameters
+    ----------
+    num : int
+        Number of points in the full sequence
+    dim : int (optional)
+        Dimension of each point.  Default is 2
+    start, stop : int (optional)
+        Index range of the points to return
+    seed : int (optional)
+        Scrambling seed.  Default None gives the plain sequence
+
+    Returns
+    -------
+    points : ndarray
+        Array of shape (points, dim)
+    """
+
+    from scipy.stats import qmc
+
+    i = _index_range(num, start, stop)
+    engine = qmc.Sobol(dim, scramble=seed is not None, seed=seed)
+    if i.size == 0:
+        return np.empty((0, dim))
+    if i[0] > 0:
+        engine.fast_forward(int(i[0]))
+
+    return engine.random(i.size)
+
+
+def to_unit_disk(points):
+    """Map points in the unit square [0,1)^2 onto the unit disk with equal
+    area (uniform density is preserved).  Returns an array of shape (N,2).
+    """
+
+    points = np.asarray(points, dtype=float)
+    r = np.sqrt(points[:,0])
+    theta = 2*np.pi*points[:,1]
+
+    disk = np.empty((points.shape[0], 2))
+    disk[:,0] = r*np.cos(theta)
+    disk[:,1] = r*np.sin(theta)
+    return disk
+
+
+def iter_chunks(sampler, total, chunk_size, *args, **kwargs):
+    """Stream a sampling pattern in chunks of at most chunk_size points.
+
+    Parameters
+    ----------
+    sampler : function
+        One of the samplers in this module (any function taking start and
+        stop keyword arguments)
+    total : int
+        Number of points in the full pattern, ex: nx*ny or hexapolar_count()
+    chunk_size : int
+        Maximum number of points per chunk
+    *args, **kwargs
+        Passed through to the sampler
+
+    Yields
+    ------
+    points : ndarray
+        The next chunk of the pattern
+    """
+
+    for start in range(0, total, chunk_size):
+        yield sampler(*args, start=start, stop=min(start + chunk_size, total),
+                      **kwargs)
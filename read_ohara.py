@@ -18,6 +18,9 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+from glass_catalog import load_ohara
+from glass_map import GlassMap
+
 
 #ohara has 140 glasses in 20171130 version
 df = pd.read_csv('OHARA_20171130_6.csv', header=[0, 1])
@@ -87,12 +90,23 @@ def update_annot(ind):
     annot.get_bbox_patch().set_alpha(0.4)
 
 
+#spatial index of the plotted glasses (same rows as the csv) for hovering
+glass_map = GlassMap(load_ohara())
+
 def hover(event):
     vis = annot.get_visible()
     if event.inaxes == ax:
-        cont, ind = sc.contains(event)
+        #5 pixels in data units along each axis; the index circle enclosing
+        #that ellipse holds every candidate, closest on screen wins
+        corner = ax.transData.inverted().transform((event.x + 5, event.y + 5))
+        radius = max(abs(corner[1] - event.ydata)/glass_map.scale[0],
+                     abs(corner[0] - event.xdata)/glass_map.scale[1])
+        rows, _ = glass_map.within(event.ydata, event.xdata, radius)
+        pos = ax.transData.transform(np.column_stack([abbe[rows], nd[rows]]))
+        dist = np.hypot(pos[:,0] - event.x, pos[:,1] - event.y)
+        cont = rows.size > 0 and dist.min() < 5
         if cont:
-            update_annot(ind)
+            update_annot({"ind": rows[[np.argmin(dist)]]})
             annot.set_visible(True)
             fig.canvas.draw_idle()
         else:
@@ -110,8 +124,8 @@ df_sell.to_json(path + '/ohara_glasses.json')
 pd.to_pickle(df_sell, path + '/ohara_glasses.pkl')
 
 
-#later add schott glasses too 
-#schottdf = pd.read_csv('schott-optical-glass-06032017.csv')  #utf-8 error
+#schott glasses (latin-1 encoded, multi-row header) are parsed by
+#glass_catalog.parse_schott_csv, and merged with ohara by load_catalog
 
 
 
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Sequential real (non-paraxial) ray trace through spherical surfaces.
+
+Matrix optics is only valid for small angles.  This module traces exact rays
+in 3D, intersecting and refracting whole ray sets one surface at a time with
+array math (the vector form of snells_law, and the sphere sag from sag_depth).
+
+A prescription is a list of surfaces, each a tuple of
+
+    (radius, thickness, material, semi_aperture)
+
+radius : radius of curvature (np.inf or 0 for a flat surface)
+thickness : distance from this surface vertex to the next one
+material : medium after the surface; an index, 'air' or a catalog glass name
+semi_aperture : clear semi-aperture (np.inf for none)
+
+Rays are stored as arrays of positions (x, y, z) and direction cosines
+(kx, ky, kz).  Rays that miss a surface, are vignetted by its aperture, or
+undergo total internal reflection are flagged in masks instead of raising;
+they keep being carried through the arrays so every array keeps its length.
+
+"""
+
+import numpy as np
+
+from glass_catalog import material_index
+
+
+class RealRays:
+    """ Struct-of-arrays set of 3D rays.
+
+    Parameters
+    ----------
+    x, y, z : array_like
+        Ray positions
+    kx, ky, kz : array_like
+        Direction cosines (normalized on construction)
+    wavelength : float (optional)
+        Wavelength in microns.  Default is the d-line, 0.5876 um
+    """
+
+    def __init__(self, x, y, z, kx, ky, kz, wavelength=0.5876):
+        x, y, z, kx, ky, kz = np.broadcast_arrays(x, y, z, kx, ky, kz)
+        self.x = np.array(x, dtype=float).ravel()
+        self.y = np.array(y, dtype=float).ravel()
+        self.z = np.array(z, dtype=float).ravel()
+
+        norm = np.sqrt(kx**2 + ky**2 + kz**2)
+        self.kx = np.array(kx/norm, dtype=float).ravel()
+        self.ky = np.array(ky/norm, dtype=float).ravel()
+        self.kz = np.array(kz/norm, dtype=float).ravel()
+
+        self.wavelength = wavelength
+        num = self.x.size
+        self.missed = np.zeros(num, dtype=bool)
+        self.vignetted = np.zeros(num, dtype=bool)
+        self.tir = np.zeros(num, dtype=bool)
+
+
+    @classmethod
+    def collimated(cls, points, semi_aperture, field_angle=0.0,
+                   wavelength=0.5876):
+        """Collimated rays through normalized pupil points (see ray_sampling)
+        scaled to semi_aperture, tilted by field_angle (degrees) in the y-z
+        plane.  Rays start on the plane z = 0.
+        """
+
+        points = np.asarray(points, dtype=float).reshape(-1,2)
+        u = np.deg2rad(field_angle)
+        return cls(semi_aperture*points[:,0], semi_aperture*points[:,1], 0.0,
+                   0.0, np.sin(u), np.cos(u), wavelength)
+
+
+    @classmethod
+    def from_point(cls, point, points, semi_aperture, distance,
+                   wavelength=0.5876):
+        """Rays from an object point (x, y, z) aimed at normalized pupil
+        points (scaled to semi_aperture) on the plane z = point[2] + distance.
+        """
+
+        points = np.asarray(points, dtype=float).reshape(-1,2)
+        px, py, pz = point
+        return cls(px, py, pz, semi_aperture*points[:,0] - px,
+                   semi_aperture*points[:,1] - py, distance, wavelength)
+
+
+    def block(self, start, stop):
+        """RealRays sharing memory with rays start..stop-1 of this set."""
+
+        view = RealRays.__new__(RealRays)
+        for name in ('x', 'y', 'z', 'kx', 'ky', 'kz', 'missed', 'vignetted',
+                     'tir'):
+            setattr(view, name, getattr(self, name)[start:stop])
+        view.wavelength = self.wavelength
+        return view
+
+
+    @property
+    def alive(self):
+        """Rays that have passed every surface so far."""
+        return ~(self.missed | self.vignetted | self.tir)
+
+
+    def __len__(self):
+        return self.x.size
+
+
+def surface_arrays(surfaces, wavelength=0.5876):
+    """Split a prescription into arrays of curvature, thickness, index and
+    semi-aperture (each of length surfaces).  Flat surfaces get curvature 0,
+    and glass names are evaluated at wavelength (microns).
+    """
+
+    radius = np.array([s[0] for s in surfaces], dtype=float)
+    with np.errstate(divide='ignore'):
+        curv = np.where((radius == 0) | np.isinf(radius), 0.0, 1/radius)
+    thickness = np.array([s[1] for s in surfaces], dtype=float)
+    index = np.array([material_index(s[2], wavelength) for s in surfaces],
+                     dtype=float)
+    semi_aper = np.array([s[3] for s in surfaces], dtype=float)
+
+    return curv, thickness, index, semi_aper
+
+
+def trace_surface(rays, curv, n1, n2, semi_aper=np.inf):
+    """Intersect and refract rays in place at one spherical surface whose
+    vertex is at the origin of the ray coordinates.
+
+    Parameters
+    ----------
+    rays : RealRays
+        The rays, in the local coordinates of the surface
+    curv : float
+        Surface curvature (1/radius, 0 for flat)
+    n1, n2 : float
+        Index before and after the surface
+    semi_aper : float (optional)
+        Clear semi-aperture.  Default is unlimited
+    """
+
+    x, y, z = rays.x, rays.y, rays.z
+    kx, ky, kz = rays.kx, rays.ky, rays.kz
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        #transfer to the vertex tangent plane, z = 0
+        t = -z/kz
+        x += t*kx
+        y += t*ky
+        z[:] = 0.0
+
+        #distance along the ray from the tangent plane to the sphere
+        F = curv*(x*x + y*y)
+        G = kz - curv*(kx*x + ky*y)
+        disc = G*G - curv*F
+        rays.missed |= disc < 0
+        t = F/(G + np.sqrt(disc))
+        x += t*kx
+        y += t*ky
+        z += t*kz
+
+        if np.isfinite(semi_aper):
+            rays.vignetted |= x*x + y*y > semi_aper*semi_aper
+
+        if n1 == n2:
+            return
+
+        #unit surface normal and refraction (vector form of snells law)
+        nx = -curv*x
+        ny = -curv*y
+        nz = 1 - curv*z
+        cos_i = kx*nx + ky*ny + kz*nz
+        mu = n1/n2
+        arg = 1 - mu*mu*(1 - cos_i*cos_i)
+        rays.tir |= arg < 0
+        g = np.sqrt(arg) - mu*cos_i
+
+        kx *= mu
+        kx += g*nx
+        ky *= mu
+        ky += g*ny
+        kz *= mu
+        kz += g*nz
+
+
+def trace(rays, surfaces, n0=1.0, record=False, block_size=16384):
+    """Trace rays sequentially through a prescription.  The rays are updated
+    in place and end up in the coordinates of the last surface.
+
+    Rays are traced in blocks of block_size through all surfaces, which keeps
+    the working arrays in cache.
+
+    Parameters
+    ----------
+    rays : RealRays
+        Starting rays, in the coordinates of the first surface vertex
+    surfaces : list
+        Prescription rows of (radius, thickness, material, semi_aperture)
+    n0 : float (optional)
+        Index of object space.  Default is 1.0 (air)
+    record : bool (optional)
+        Also return the ray intersection points at every surface
+    block_size : int (optional)
+        Number of rays traced together.  Default is 16384
+
+    Returns
+    -------
+    rays : RealRays
+        The traced rays (same object as the input)
+    points : ndarray
+        Only when record is True.  Intersection points, shape
+        (surfaces, rays, 3), each in its surface's local coordinates
+    """
+
+    curv, thickness, index, semi_aper = surface_arrays(surfaces,
+                                                       rays.wavelength)
+    if record:
+        points = np.empty((len(surfaces), len(rays), 3))
+
+    for start in range(0, len(rays), block_size):
+        stop = min(start + block_size, len(rays))
+        block = rays.block(start, stop)
+        n1 = n0
+        for j in range(len(surfaces)):
+            if j > 0:
+                block.z -= thickness[j-1]   #move into this surface's coordinates
+            trace_surface(block, curv[j], n1, index[j], semi_aper[j])
+            n1 = index[j]
+            if record:
+                points[j,start:stop,0] = block.x
+                points[j,start:stop,1] = block.y
+                points[j,start:stop,2] = block.z
+
+    if record:
+        return rays, points
+    return rays
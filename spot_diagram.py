@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Spot diagram statistics from traced rays: centroid, RMS radius, geometric
+radius and encircled energy.
+
+Ray landing positions are arrays of shape (..., rays), ex: (fields,
+wavelengths, rays), and every statistic is a reduction over the last axis, so
+all fields and wavelengths are evaluated together.  Rays carry optional
+weights (energy, ex: from DispersiveSystem.throughput) and an alive mask
+(vignetted, missed or TIR rays have zero weight and are ignored, even when
+their positions are NaN).
+
+Radii are measured from the weighted centroid.  Encircled energy curves are
+binned with one searchsorted and one bincount over every row, and percentile
+radii (ex: EE80) use np.partition when the rays are equally weighted, so only
+weighted percentiles need a full sort.
+
+Matrix optics rays are meridional (heights only); their spots are 1D, with x
+taken as zero.
+
+"""
+
+import numpy as np
+
+from real_ray_trace import RealRays
+
+
+class SpotDiagram:
+    """ Ray landing positions on an image plane, shape (..., rays).
+
+    Parameters
+    ----------
+    x, y : array_like
+        Ray coordinates on the image plane.  x may be None for meridional
+        (matrix optics) rays
+    weights : array_like (optional)
+        Relative ray energy, broadcastable to the shape of y.  Default is
+        equal weights
+    alive : array_like (optional)
+        False for rays that did not reach the plane
+    """
+
+    def __init__(self, x, y, weights=None, alive=None):
+        self.y = np.asarray(y, dtype=float)
+        shape = self.y.shape
+        self.x = None if x is None else np.broadcast_to(
+            np.asarray(x, dtype=float), shape)
+        self.alive = None if alive is None else np.broadcast_to(
+            np.asarray(alive, dtype=bool), shape)
+
+        if weights is None:
+            w = None if alive is None else self.alive.astype(float)
+        else:
+            w = np.broadcast_to(np.asarray(weights, dtype=float), shape)
+            if alive is not None:
+                w = np.where(self.alive, w, 0.0)
+        self.weights = w
+        self.equal_weights = weights is None
+
+        if alive is not None:
+            #dead rays may sit at NaN; park them at the origin
+            self.y = np.where(self.alive, self.y, 0.0)
+            if self.x is not None:
+                self.x = np.where(self.alive, self.x, 0.0)
+
+        self.total = shape[-1] if w is None else w.sum(axis=-1)
+        self._centroid = None
+        self._radii = None
+
+
+    @classmethod
+    def from_real_rays(cls, rays, weights=None):
+        """Spot of traced RealRays (see real_ray_trace.trace), or of nested
+        lists of them with equal ray counts, ex: [field][wavelength]."""
+
+        def stack(r, name):
+            if isinstance(r, RealRays):
+                return r.alive if name == 'alive' else getattr(r, name)
+            return np.stack([stack(item, name) for item in r])
+
+        return cls(stack(rays, 'x'), stack(rays, 'y'), weights,
+                   stack(rays, 'alive'))
+
+
+    @classmethod
+    def from_ray_matrix(cls, ray_matrix, energy=None, plane=-1):
+        """Meridional spot from matrix optics output.
+
+        Parameters
+        ----------
+        ray_matrix : ndarray
+            Propagated rays, shape (..., rays, planes, 2), ex: from
+            DispersiveSystem.propagate, or (..., rays, 2) for a single plane
+            when plane is None
+        energy : ndarray (optional)
+            Ray energy, shape (..., rays, planes), ex: from
+            DispersiveSystem.throughput, or (..., rays) when plane is None
+        plane : int or None (optional)
+            Plane of the spot.  Default is the last one.  None means
+            ray_matrix (and energy) hold a single plane, with no planes axis
+
+        Examples
+        --------
+        A batch of 4 single-plane bundles of 1000 rays gives 4 spots:
+
+        >>> yu = np.zeros((4, 1000, 2))
+        >>> yu[...,0] = np.linspace(-1, 1, 1000)
+        >>> SpotDiagram.from_ray_matrix(yu, plane=None).rms_radius().shape
+        (4,)
+        """
+
+        ray_matrix = np.asarray(ray_matrix)
+        if plane is None:
+            y = ray_matrix[...,0]
+        else:
+            y = ray_matrix[...,plane,0]
+        if energy is not None and plane is not None:
+            energy = np.asarray(energy)[...,plane]
+
+        return cls(None, y, energy)
+
+
+    def __len__(self):
+        return self.y.shape[-1]
+
+
+    def _mean(self, a):
+        if self.weights is None:
+            return a.mean(axis=-1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.einsum('...i,...i->...', a, self.weights)/self.total
+
+
+    def centroid(self):
+        """Weighted centroid (cx, cy), each of the batch shape."""
+
+        if self._centroid is None:
+            cy = self._mean(self.y)
+            cx = np.zeros_like(cy) if self.x is None else self._mean(self.x)
+            self._centroid = (cx, cy)
+        return self._centroid
+
+
+    def _radial(self):
+        """Squared distance of every ray from the centroid."""
+
+        if self._radii is None:
+            cx, cy = self.centroid()
+            r2 = self.y - cy[...,None]
+            r2 *= r2
+            if self.x is not None:
+                dx = self.x - cx[...,None]
+                r2 += dx*dx
+            self._radii = r2
+        return self._radii
+
+
+    def rms_radius(self):
+        """RMS spot radius about the centroid, of the batch shape."""
+        return np.sqrt(self._mean(self._radial()))
+
+
+    def geometric_radius(self):
+        """Largest distance of a live ray from the centroid."""
+
+        r2 = self._radial()
+        live = True if self.weights is None else self.weights > 0
+        return np.sqrt(np.max(r2, axis=-1, where=live, initial=0.0))
+
+
+    def radii(self):
+        """Distance of every ray from the centroid, inf for dead rays."""
+
+        r = np.sqrt(self._radial())
+        if self.weights is not None:
+            r[self.weights <= 0] = np.inf
+        return r
+
+
+    def encircled_energy(self, radii):
+        """Fraction of the energy within each radius of the centroid.
+
+        Parameters
+        ----------
+        radii : array_like
+            Increasing radii, shape (K,)
+
+        Returns
+        -------
+        ee : ndarray
+            Encircled energy, shape (..., K)
+        """
+
+        radii = np.atleast_1d(np.asarray(radii, dtype=float))
+        r = self.radii()
+        batch = r.shape[:-1]
+        rows = int(np.prod(batch))
+        K = radii.size
+
+        #bin k holds rays with radii[k-1] < r <= radii[k]; dead rays land in K
+        bins = np.searchsorted(radii, r.reshape(rows, -1), side='left')
+        bins += (K + 1)*np.arange(rows)[:,None]
+        w = None if self.weights is None else self.weights.reshape(rows, -1)
+        counts = np.bincount(bins.ravel(),
+                             None if w is None else w.ravel(),
+                             minlength=rows*(K + 1)).reshape(rows, K + 1)
+
+        total = len(self) if w is None else np.reshape(self.total, (rows, 1))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ee = np.cumsum(counts[:,:K], axis=1)/total
+        return ee.reshape(batch + (K,))
+
+
+    def ee_radius(self, fraction=0.8):
+        """Radius about the centroid enclosing a fraction of the energy, ex:
+        fraction=0.8 for EE80.
+
+        Parameters
+        ----------
+        fraction : float or array_like
+            Energy fractions in (0, 1], shape (F,)
+
+        Returns
+        -------
+        radius : ndarray
+            Radii of the batch shape, plus (F,) for an array of fractions
+        """
+
+        fractions = np.atleast_1d(np.asarray(fraction, dtype=float))
+        r = self.radii()
+        batch = r.shape[:-1]
+        r = r.reshape(-1, r.shape[-1])
+        rows = r.shape[0]
+
+        if self.equal_weights:
+            #kth smallest radius with k from the live ray count of each row
+            count = np.broadcast_to(self.total, batch).reshape(rows, 1)
+            k = np.ceil(fractions*count).astype(int) - 1
+            k = np.clip(k, 0, r.shape[1] - 1)
+            part = np.partition(r, np.unique(k), axis=1)
+            out = np.take_along_axis(part, k, axis=1)
+        else:
+            order = np.argsort(r, axis=1)
+            w = np.take_along_axis(self.weights.reshape(rows, -1), order, 1)
+            cum = np.cumsum(w, axis=1)
+            target = fractions*cum[:,-1:]
+            k = np.empty((rows, fractions.size), dtype=int)
+            for f in range(fractions.size):
+                k[:,f] = np.count_nonzero(cum < target[:,f,None], axis=1)
+            k = np.minimum(k, r.shape[1] - 1)
+            out = np.take_along_axis(np.take_along_axis(r, order, 1), k, 1)
+
+        out = out.reshape(batch + fractions.shape)
+        return out if np.ndim(fraction) else out[...,0]
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Thin film multilayer coatings by the characteristic matrix method.
+
+Extends optical_calcs.fresnel_refl (a single bare interface) to stacks of
+absorbing layers.  Each layer j has the characteristic matrix
+
+    M_j = [[cos(d_j),           -i*sin(d_j)/eta_j],
+           [-i*eta_j*sin(d_j),  cos(d_j)         ]]
+
+with phase thickness d_j = 2*pi*N_j*t_j*cos(theta_j)/wavelength and tilted
+admittance eta_j = N_j*cos(theta_j) (s) or N_j/cos(theta_j) (p).  The stack
+response follows from [B, C] = M_1 M_2 ... M_L [1, eta_substrate].
+
+Everything is batched: reflectance and transmittance are computed for all
+stack variants x wavelengths x angles x polarizations at once, one layer at a
+time, by applying the layer matricies to the (B, C) vectors.
+
+Conventions: wavelengths and thicknesses in microns, angles of incidence in
+radians, complex indices written n + ik with k >= 0 for absorbing media.
+Materials can be numbers, arrays over wavelength, 'air', or catalog glass
+names (evaluated with glass_catalog).
+
+"""
+
+import numpy as np
+
+from glass_catalog import material_index
+
+
+def _index(material, wavelengths):
+    """Complex index of a material over the wavelength grid, shape (W,)."""
+
+    if isinstance(material, str):
+        return material_index(material, wavelengths).astype(complex)
+    return np.broadcast_to(np.asarray(material, dtype=complex),
+                           wavelengths.shape)
+
+
+def layer_indices(materials, wavelengths):
+    """Evaluate a list of layer materials over the wavelength grid.  Returns a
+    complex array of shape (W, layers)."""
+
+    wavelengths = np.atleast_1d(np.asarray(wavelengths, dtype=float))
+    if len(materials) == 0:
+        return np.empty((wavelengths.size, 0), dtype=complex)
+    return np.stack([_index(m, wavelengths) for m in materials], axis=-1)
+
+
+def quarter_wave(n, wavelength):
+    """Physical thickness of a quarter wave layer of index n at wavelength."""
+    return wavelength/(4*np.real(n))
+
+
+def _cos_theta(N, n0_sin):
+    """N*cos(theta) inside a medium of index N, with the branch that decays
+    into the medium (imaginary part >= 0 for the n + ik convention)."""
+
+    arg = N*N - n0_sin*n0_sin
+    if not np.any(arg.imag) and np.all(arg.real >= 0):
+        #lossless and propagating: real square root is much faster
+        return np.sqrt(arg.real).astype(complex)
+
+    Ncos = np.sqrt(arg)
+    flip = (Ncos.imag < 0) | ((Ncos.imag == 0) & (Ncos.real < 0))
+    return np.where(flip, -Ncos, Ncos)
+
+
+def stack_response(wavelengths, angles, materials, thicknesses, n0=1.0,
+                   substrate=1.52):
+    """Reflectance and transmittance of a multilayer stack.
+
+    Parameters
+    ----------
+    wavelengths : array_like
+        Wavelengths in microns, shape (W,)
+    angles : array_like
+        Angles of incidence in the incident medium (radians), shape (A,)
+    materials : list or ndarray
+        Layer materials from the incident side to the substrate, either a list
+        of L materials (number, array over wavelength, or glass name) or a
+        complex array broadcastable to (V, W, L) for per-variant indices
+    thicknesses : array_like
+        Physical layer thicknesses in microns, shape (L,) or (V, L) for V
+        stack variants
+    n0 : float or str (optional)
+        Incident medium.  Default is 1.0 (air)
+    substrate : float or str (optional)
+        Substrate index or catalog glass name.  Default is 1.52
+
+    Returns
+    -------
+    R : ndarray
+        Reflectance, shape (V, W, A, 2) with polarization (s, p) last.  The
+        V axis is dropped when thicknesses is 1D
+    T : ndarray
+        Transmittance into the substrate, same shape
+    """
+
+    wavelengths = np.atleast_1d(np.asarray(wavelengths, dtype=float))
+    angles = np.atleast_1d(np.asarray(angles, dtype=float))
+    thicknesses = np.asarray(thicknesses, dtype=float)
+    single = thicknesses.ndim == 1
+    t = np.atleast_2d(thicknesses)                              #(V, L)
+
+    if isinstance(materials, np.ndarray):
+        N = np.broadcast_to(materials.astype(complex),
+                            (t.shape[0], wavelengths.size, t.shape[1]))
+    else:
+        N = layer_indices(materials, wavelengths)[None]        #(1, W, L)
+
+    #broadcast everything to (V, W, A, pol)
+    wl = wavelengths[None,:,None,None]
+    N0 = _index(n0, wavelengths)[None,:,None,None]
+    Ns = _index(substrate, wavelengths)[None,:,None,None]
+    n0_sin = N0*np.sin(angles)[None,None,:,None]               #invariant
+
+    def admittance(N_cos, N):
+        #(s, p) along the last axis
+        return np.concatenate(np.broadcast_arrays(N_cos, N*N/N_cos), axis=-1)
+
+    eta0 = admittance(_cos_theta(N0, n0_sin), N0)
+    eta_s = admittance(_cos_theta(Ns, n0_sin), Ns)
+
+    shape = np.broadcast_shapes((t.shape[0], 1, 1, 1), eta_s.shape)
+    B = np.ones(shape, dtype=complex)
+    C = np.broadcast_to(eta_s, shape).copy()
+
+    #apply the layers from the substrate side out: [B, C] <- M_j [B, C]
+    for j in range(t.shape[1]-1, -1, -1):
+        Nj = N[:,:,j][:,:,None,None]
+        Nj_cos = _cos_theta(Nj, n0_sin)
+        eta = admittance(Nj_cos, Nj)
+        #phase thickness is the same for s and p
+        delta = (2*np.pi*t[:,j])[:,None,None,None]*(Nj_cos/wl)
+        if np.any(delta.imag):
+            cos_d = np.cos(delta)
+            isin_d = -1j*np.sin(delta)   #n + ik sign convention
+        else:
+            cos_d = np.cos(delta.real)
+            isin_d = -1j*np.sin(delta.real)
+        B, C = cos_d*B + (isin_d/eta)*C, (isin_d*eta)*B + cos_d*C
+
+    denom = eta0*B + C
+    r = (eta0*B - C)/denom
+    R = np.abs(r)**2
+    T = 4*np.real(eta0)*np.real(eta_s)/np.abs(denom)**2
+
+    if single:
+        return R[0], T[0]
+    return R, T
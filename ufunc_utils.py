@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers shared by the ufunc-style calculation modules (optical_calcs,
+first_order_optics): allocate the output array for broadcast inputs, and
+unwrap or mask the result.
+
+"""
+
+import numpy as np
+
+
+def out_array(out, *args):
+    """Return out, or a new float array with the broadcast shape of args."""
+
+    if out is None:
+        out = np.empty(np.broadcast_shapes(*[np.shape(a) for a in args]))
+    return out
+
+
+def ufunc_result(out, given, valid=None, mask=False):
+    """Unwrap 0-d results to scalars (unless out was given) and attach the
+    valid mask when requested."""
+
+    if not given and out.ndim == 0:
+        out = out[()]
+        if valid is not None:
+            valid = valid[()]
+    if mask:
+        return out, valid
+    return out
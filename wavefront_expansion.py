@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Wavefront aberration power series (Seidel W_ijk expansion).
+
+The wavefront at normalized field height H and normalized pupil point
+(rho, theta) is
+
+    W(H, rho, theta) = sum over ijk of  W_ijk * H**i * rho**j * cos(theta)**k
+
+with theta measured from the x axis, the direction of the field (as in
+wavefront_expansion.ipynb).  Every field and pupil point is evaluated in one
+contraction: the terms are grouped by pupil factor rho**j*cos**k, the field
+factors sum W_ijk*H**i into a (fields, groups) matrix, the pupil factors form
+a (groups, points) matrix, and the map is their product.  Powers of H, rho and
+cos(theta) are built once by repeated multiplication and shared across terms.
+
+Pupil samples come from ray_sampling (ex: polar_rings, hexapolar), as (x, y)
+points or as rho, theta arrays.
+
+Images are rendered by evaluating the (analytic) wavefront directly at the
+pixels of a Cartesian or polar grid inside the pupil, rather than
+interpolating scattered samples (the notebook's griddata step).  Grids are
+cached by size, so repeated renders only pay for the evaluation, O(pixels).
+
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+from zernike import zernike_basis
+
+
+#primary (Seidel) and first order terms as (i, j, k)
+SEIDEL_TERMS = {'piston': (0, 0, 0),
+                'defocus': (0, 2, 0),
+                'tilt': (1, 1, 1),
+                'spherical': (0, 4, 0),
+                'coma': (1, 3, 1),
+                'astigmatism': (2, 2, 2),
+                'field_curvature': (2, 2, 0),
+                'distortion': (3, 1, 1)}
+
+
+def term_indices(name):
+    """(i, j, k) of a term given as a tuple, 'W131' style string or a name in
+    SEIDEL_TERMS."""
+
+    if isinstance(name, str):
+        if name in SEIDEL_TERMS:
+            return SEIDEL_TERMS[name]
+        digits = name.upper().lstrip('W')
+        if len(digits) != 3 or not digits.isdigit():
+            raise ValueError('unknown wavefront term {}'.format(name))
+        return tuple(int(d) for d in digits)
+    return tuple(int(d) for d in name)
+
+
+def parse_terms(terms):
+    """Exponents and coefficients of a term dict, ex: {'W040': 0.25,
+    'coma': 0.1, (2, 2, 2): -0.05}.  Returns (ijk (T, 3) int array,
+    coefficients (T,))."""
+
+    ijk = np.array([term_indices(t) for t in terms], dtype=int).reshape(-1, 3)
+    coefficients = np.array([terms[t] for t in terms], dtype=float)
+    return ijk, coefficients
+
+
+def _powers(x, num):
+    """x**0 .. x**(num-1) stacked on a new first axis, by repeated
+    multiplication."""
+
+    x = np.asarray(x, dtype=float)
+    out = np.empty((num,) + x.shape)
+    out[0] = 1.0
+    for p in range(1, num):
+        np.multiply(out[p-1], x, out=out[p])
+    return out
+
+
+def field_factors(terms, H):
+    """Field factors of the expansion, shape (fields, groups), and the
+    (j, k) pupil exponents of each group, shape (groups, 2)."""
+
+    ijk, coefficients = parse_terms(terms)
+    H = np.atleast_1d(np.asarray(H, dtype=float))
+    jk, group = np.unique(ijk[:,1:], axis=0, return_inverse=True)
+
+    #C[g, i] = sum of W_ijk over the terms of group g with field power i
+    C = np.zeros((jk.shape[0], ijk[:,0].max() + 1 if ijk.size else 1))
+    np.add.at(C, (group.ravel(), ijk[:,0]), coefficients)
+
+    return (C @ _powers(H, C.shape[1])).T, jk
+
+
+def pupil_factors(jk, rho, cos_theta):
+    """rho**j*cos(theta)**k for each (j, k) group, shape (groups, points)."""
+
+    if jk.size == 0:
+        return np.empty((0,) + np.shape(rho))
+    rho_p = _powers(rho, jk[:,0].max() + 1)
+    cos_p = _powers(cos_theta, jk[:,1].max() + 1)
+    return rho_p[jk[:,0]]*cos_p[jk[:,1]]
+
+
+def wavefront_polar(terms, H, rho, theta, out=None):
+    """Expanded wavefront at every field height and pupil point.
+
+    Parameters
+    ----------
+    terms : dict
+        W_ijk coefficients keyed by (i, j, k), 'W131' style strings or
+        SEIDEL_TERMS names
+    H : array_like
+        Normalized field heights, shape (fields,)
+    rho, theta : array_like
+        Normalized pupil radius and azimuth (from the field direction),
+        shape (points,)
+    out : ndarray (optional)
+        Array of shape (fields, points) to store the result in
+
+    Returns
+    -------
+    W : ndarray
+        Wavefront in the units of the coefficients, shape (fields, points)
+    """
+
+    A, jk = field_factors(terms, H)
+    B = pupil_factors(jk, np.ravel(rho), np.cos(np.ravel(theta)))
+    return np.matmul(A, B, out=out)
+
+
+def wavefront(terms, H, points, out=None):
+    """Expanded wavefront at every field height for (x, y) pupil points of
+    shape (points, 2), ex: from ray_sampling.polar_rings.  See
+    wavefront_polar."""
+
+    points = np.asarray(points, dtype=float)
+    rho = np.hypot(points[:,0], points[:,1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cos_theta = np.where(rho > 0, points[:,0]/rho, 1.0)
+
+    A, jk = field_factors(terms, H)
+    return np.matmul(A, pupil_factors(jk, rho, cos_theta), out=out)
+
+
+class PupilGrid:
+    """ Render grid over the unit pupil.
+
+    Parameters
+    ----------
+    size : int
+        Pixels along each axis
+    polar : bool (optional)
+        Polar grid of (theta, rho) instead of Cartesian (y, x).  Default is
+        False
+    obscuration : float (optional)
+        Central obscuration as a fraction of the pupil radius.  Default is 0
+
+    Attributes
+    ----------
+    x, y : ndarray
+        Pixel axes: x and y for a Cartesian grid, rho and theta for a polar
+        grid
+    rho, theta : ndarray
+        Pupil coordinates of every pixel, shape (size, size)
+    valid : ndarray
+        Pixels inside the pupil, shape (size, size)
+    """
+
+    def __init__(self, size, polar=False, obscuration=0.0):
+        if polar:
+            self.x = np.linspace(obscuration, 1, size)
+            self.y = np.linspace(0, 2*np.pi, size)
+            self.rho, self.theta = np.meshgrid(self.x, self.y)
+        else:
+            self.x = self.y = np.linspace(-1, 1, size)
+            X, Y = np.meshgrid(self.x, self.y)
+            self.rho, self.theta = np.hypot(X, Y), np.arctan2(Y, X)
+
+        self.shape = self.rho.shape
+        self.polar = polar
+        self.valid = (self.rho <= 1) & (self.rho >= obscuration)
+        self.points = np.flatnonzero(self.valid)
+        self.rho_valid = self.rho.ravel()[self.points]
+        self.theta_valid = self.theta.ravel()[self.points]
+
+        for a in (self.x, self.y, self.rho, self.theta, self.valid,
+                  self.points, self.rho_valid, self.theta_valid):
+            a.flags.writeable = False
+
+
+    def image(self, values, fill=np.nan):
+        """Scatter values at the valid pixels, shape (..., valid pixels),
+        into images of shape (..., size, size) filled outside the pupil."""
+
+        values = np.asarray(values)
+        out = np.full(values.shape[:-1] + (self.valid.size,), fill,
+                      dtype=np.result_type(values, fill))
+        out[...,self.points] = values
+        return out.reshape(values.shape[:-1] + self.shape)
+
+
+@lru_cache(maxsize=8)
+def pupil_grid(size=100, polar=False, obscuration=0.0):
+    """Cached PupilGrid, shared by every render at that resolution."""
+    return PupilGrid(size, polar, obscuration)
+
+
+def render_wavefront(terms, H=1.0, size=100, polar=False, obscuration=0.0):
+    """Image of the expanded wavefront on a pupil grid (see pupil_grid for
+    the pixel axes).
+
+    Parameters
+    ----------
+    terms : dict
+        W_ijk coefficients, as for wavefront_polar
+    H : float or array_like (optional)
+        Normalized field height(s).  Default is 1
+    size : int (optional)
+        Pixels along each axis.  Default is 100
+    polar : bool (optional)
+        Render on a (theta, rho) grid.  Default is False
+    obscuration : float (optional)
+        Central obscuration as a fraction of the pupil radius.  Default is 0
+
+    Returns
+    -------
+    W : ndarray
+        Wavefront, NaN outside the pupil, shape (size, size) or (fields,
+        size, size) for an array of H
+    """
+
+    grid = pupil_grid(size, polar, obscuration)
+    W = grid.image(wavefront_polar(terms, H, grid.rho_valid,
+                                   grid.theta_valid))
+    return W if np.ndim(H) else W[0]
+
+
+def render_zernike(coefficients, indices, size=100, polar=False,
+                   obscuration=0.0, ordering='osa', normalize=None):
+    """Image of a Zernike wavefront on a pupil grid.  coefficients has shape
+    (terms,) or (..., terms); returns (..., size, size), NaN outside the
+    pupil.  Terms are normalized as in zernike.zernike_basis."""
+
+    grid = pupil_grid(size, polar, obscuration)
+    basis = zernike_basis(indices, grid.rho_valid, grid.theta_valid, ordering,
+                          normalize=normalize)
+    return grid.image(np.asarray(coefficients, dtype=float) @ basis)
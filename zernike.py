@@ -1,37 +1,39 @@
 '''
 
-Plot Zernike polynomials.  Uses the first 14 modes of OSA/ANSI indexing
+Zernike polynomials of any order, in OSA/ANSI, Noll or Fringe indexing.
 
-3D ploting based on matplotlib example by Armin Moser: surface3d_radial_demo.py
+Radial polynomials come from the recurrence
+
+    R_n^m(rho) = rho*(R_{n-1}^{|m-1|}(rho) + R_{n-1}^{m+1}(rho)) - R_{n-2}^m(rho)
+
+with R_n^n = rho**n, which is numerically stable to high order (unlike the
+explicit factorial sums) and builds every order from the previous two, so
+powers of rho are shared by all terms.  cos(m*theta) and sin(m*theta) come
+from the Chebyshev recurrence on cos(theta), so only one cos and one sin are
+evaluated per point.  Terms are Z = N*R_n^|m|*cos(m*theta) for m >= 0 and
+N*R_n^|m|*sin(|m|*theta) for m < 0.  OSA/ANSI and Noll terms are normalized
+to unit RMS over the unit disk (N = sqrt((2 - delta_m0)*(n + 1))), while
+Fringe (University of Arizona) terms are conventionally peak normalized
+(N = 1, unit value at the pupil edge), matching interferometer and Zemax
+Fringe coefficients.  The normalize argument overrides the convention.
+
+zernike_basis returns a (terms, points) matrix; bases are cached keyed on the
+sampling grid, so repeated fits and renders on the same grid don't recompute.
+
+Importing this module does not plot anything or load matplotlib; the plots
+are in plotting.py and run when this file is executed as a script.
 
 
 '''
 
-from mpl_toolkits.mplot3d import Axes3D
-from matplotlib import pyplot as plt
+import hashlib
+from collections import OrderedDict
+
 import numpy as np
 
 
-# Define functions and corresponding labels.
-# Using first 14 modes in OSA/ANSI indexing
-
-Z_polys = ['1', 
-           '2*R*np.sin(Theta)',
-           '2*R*np.cos(Theta)',
-           'np.sqrt(6)*R**2*np.sin(2*Theta)',
-           'np.sqrt(3)*(2*R**2 - 1)',
-           'np.sqrt(6)*R**2*np.cos(2*Theta)',
-           'np.sqrt(8)*R**3*np.sin(3*Theta)',
-           'np.sqrt(8)*(3*R**3 - 2*R)*np.sin(Theta)',
-           'np.sqrt(8)*(3*R**3 - 2*R)*np.cos(Theta)',
-           'np.sqrt(8)*R**3*np.cos(3*Theta)',
-           'np.sqrt(10)*R**4*np.sin(4*Theta)',
-           'np.sqrt(10)*(4*R**4 - 3*R**2)*np.sin(2*Theta)',
-           'np.sqrt(5)*(6*R**4 - 6*R**2 + 1)',
-           'np.sqrt(10)*(4*R**4 - 3*R**2)*np.cos(2*Theta)',
-           'np.sqrt(10)*R**4*np.cos(4*Theta)',
-          ]
-                                   
+# Labels of the first 15 modes in OSA/ANSI indexing
+
 Z_labels = [r'$Z^0_0 , Z_j = 1$, Piston',
             r'$Z^{-1}_1, Z_j = 2\rho sin(\theta),$  Vertical tilt ',
             r'$Z^{1}_1, Z_j = 2\rho cos(\theta),$  Horizontal tilt ',
@@ -49,32 +51,255 @@ Z_labels = [r'$Z^0_0 , Z_j = 1$, Piston',
             r'$Z^{4}_4, Z_j = \sqrt{10} \rho^4 \cos{4\theta},$  Vertical Quadrafoil ',      
             ]
 
-def plot_zernikes(osa_index):
-    """ can make plots up to index 14 (OSA/ANSI)
+def osa_to_nm(j):
+    """Radial order n and azimuthal frequency m of OSA/ANSI indices
+    (starting at 0)."""
+
+    j = np.asarray(j, dtype=int)
+    n = np.ceil((np.sqrt(9 + 8*j) - 3)/2 - 1e-9).astype(int)
+    return n, 2*j - n*(n + 2)
+
+
+def nm_to_osa(n, m):
+    """OSA/ANSI index of the (n, m) term."""
+    return (np.asarray(n)*(np.asarray(n) + 2) + np.asarray(m))//2
+
+
+def noll_to_nm(j):
+    """(n, m) of Noll indices (starting at 1)."""
+
+    j = np.asarray(j, dtype=int)
+    n = (np.sqrt(2*j - 1) + 0.5).astype(int) - 1
+    odd = n % 2 == 1
+    m = np.where(odd, 2*((2*(j + 1) - n*(n + 1))//4) - 1,
+                 2*((2*j + 1 - n*(n + 1))//4))
+    return n, np.where(j % 2 == 1, -m, m)
+
+
+def fringe_to_nm(j):
+    """(n, m) of Fringe (University of Arizona) indices (starting at 1).
+    Terms are ordered by (n + |m|)/2, then by decreasing |m|, cos before sin.
     """
 
-    # Create the mesh in polar coordinates and compute corresponding Z.
-    r = np.linspace(0, 1.25, 100)
-    theta = np.linspace(0, 2*np.pi, 100)
-    R, Theta = np.meshgrid(r, theta) 
-    
-    fig = plt.figure()
-    ax = fig.add_subplot(111, projection='3d')
-    Z = eval(Z_polys[osa_index])  #select polynomial
-    
-    # Express the mesh in the cartesian system.
-    X, Y = R*np.cos(Theta), R*np.sin(Theta)
+    j = np.asarray(j, dtype=int)
+    table = [(0, 0)]
+    k = 0
+    while len(table) < j.max(initial=1):
+        k += 1
+        for m in range(k, -1, -1):
+            table.append((2*k - m, m))
+            if m:
+                table.append((2*k - m, -m))
+    table = np.array(table)
+    return table[j - 1,0], table[j - 1,1]
+
+
+_TO_NM = {'osa': osa_to_nm, 'ansi': osa_to_nm, 'noll': noll_to_nm,
+          'fringe': fringe_to_nm}
+
+
+def index_to_nm(indices, ordering='osa'):
+    """(n, m) arrays for indices in an ordering: 'osa' (or 'ansi', from 0),
+    'noll' or 'fringe' (from 1)."""
+
+    try:
+        to_nm = _TO_NM[ordering.lower()]
+    except KeyError:
+        raise ValueError('unknown ordering: {}'.format(ordering)) from None
+    return to_nm(np.atleast_1d(indices))
+
+
+def radial_polynomials(n, m, rho):
+    """Zernike radial polynomials R_n^|m| for each (n, m) pair over the
+    points rho, shape (terms, points).  Every order up to max(n) is built
+    once by the recurrence; only two orders are kept in memory."""
+
+    n = np.atleast_1d(n)
+    m = np.abs(np.atleast_1d(m))
+    rho = np.asarray(rho, dtype=float).ravel()
+    out = np.empty((n.size, rho.size))
+    wanted = {}
+    for t, key in enumerate(zip(n.tolist(), m.tolist())):
+        wanted.setdefault(key, []).append(t)
+
+    prev2, prev1 = {}, {}
+    for order in range(n.max(initial=0) + 1):
+        cur = {}
+        for mm in range(order % 2, order + 1, 2):
+            if mm == order:
+                cur[mm] = prev1[order-1]*rho if order else np.ones(rho.size)
+            else:
+                cur[mm] = rho*(prev1[abs(mm-1)] + prev1[mm+1]) - prev2[mm]
+            for t in wanted.get((order, mm), ()):
+                out[t] = cur[mm]
+        prev2, prev1 = prev1, cur
+
+    return out
+
+
+def _azimuthal(m, theta):
+    """cos(m*theta) for m >= 0 and sin(|m|*theta) for m < 0, shape (terms,
+    points), from the Chebyshev recurrence."""
+
+    theta = np.asarray(theta, dtype=float).ravel()
+    out = np.empty((m.size, theta.size))
+    c1, s1 = np.cos(theta), np.sin(theta)
+    c_prev, s_prev = np.ones(theta.size), np.zeros(theta.size)
+    c, s = c1, s1
+    wanted = {}
+    for t, mm in enumerate(m.tolist()):
+        wanted.setdefault(abs(mm), []).append(t)
+
+    for mm in range(np.abs(m).max(initial=0) + 1):
+        if mm == 0:
+            c_cur, s_cur = c_prev, s_prev
+        elif mm == 1:
+            c_cur, s_cur = c, s
+        else:
+            c_cur = 2*c1*c - c_prev
+            s_cur = 2*c1*s - s_prev
+            c_prev, s_prev, c, s = c, s, c_cur, s_cur
+        for t in wanted.get(mm, ()):
+            out[t] = c_cur if m[t] >= 0 else s_cur
 
-    plt.title(Z_labels[osa_index])
-    ax.plot_surface(X, Y, Z, cmap=plt.cm.jet)
-    ax.set_zlim(-2*np.pi, 2*np.pi)
+    return out
 
-    plt.show()
+
+_BASIS_CACHE = OrderedDict()
+BASIS_CACHE_SIZE = 8
+
+
+def _grid_key(*arrays):
+    h = hashlib.sha1()
+    for a in arrays:
+        h.update(str(a.shape).encode())
+        h.update(np.ascontiguousarray(a).tobytes())
+    return h.digest()
+
+
+def rms_normalized(ordering, normalize=None):
+    """Whether terms are RMS normalized: normalize if given, otherwise the
+    convention of the ordering (False for 'fringe', True otherwise)."""
+
+    if normalize is None:
+        return ordering.lower() != 'fringe'
+    return bool(normalize)
+
+
+def zernike_basis(indices, rho, theta, ordering='osa', cache=True,
+                  normalize=None):
+    """Zernike terms evaluated over a set of pupil points.
+
+    Parameters
+    ----------
+    indices : int or array_like
+        Term indices in the given ordering (ex: range(231) for every OSA term
+        up to n = 20)
+    rho, theta : array_like
+        Normalized pupil radius and azimuth (radians) of the points, any
+        (matching) shape
+    ordering : str (optional)
+        'osa'/'ansi' (from 0, default), 'noll' or 'fringe' (from 1)
+    cache : bool (optional)
+        Keep the result, keyed on the indices and the sampling grid, and
+        return it (read-only) for repeated calls.  Default is True
+    normalize : bool (optional)
+        True for unit RMS terms, False for unnormalized (unit peak) terms.
+        Default is the convention of the ordering: RMS for 'osa' and 'noll',
+        peak for 'fringe'
+
+    Returns
+    -------
+    basis : ndarray
+        Shape (terms, points) with the points flattened from rho
+    """
+
+    indices = np.atleast_1d(np.asarray(indices, dtype=int))
+    rho = np.asarray(rho, dtype=float)
+    theta = np.broadcast_to(np.asarray(theta, dtype=float), rho.shape)
+    normalize = rms_normalized(ordering, normalize)
+
+    if cache:
+        key = (ordering.lower(), normalize, indices.tobytes(),
+               _grid_key(rho, theta))
+        basis = _BASIS_CACHE.get(key)
+        if basis is not None:
+            _BASIS_CACHE.move_to_end(key)
+            return basis
+
+    n, m = index_to_nm(indices, ordering)
+    basis = radial_polynomials(n, m, rho)
+    basis *= _azimuthal(m, theta)
+    if normalize:
+        basis *= np.sqrt(np.where(m == 0, 1.0, 2.0)*(n + 1))[:,None]
+
+    if cache:
+        basis.flags.writeable = False
+        _BASIS_CACHE[key] = basis
+        if len(_BASIS_CACHE) > BASIS_CACHE_SIZE:
+            _BASIS_CACHE.popitem(last=False)
+
+    return basis
+
+
+def zernike_surface(coefficients, rho, theta, ordering='osa', indices=None,
+                    normalize=None):
+    """Sum of Zernike terms over the pupil points.
+
+    Parameters
+    ----------
+    coefficients : array_like
+        Term coefficients, shape (terms,) or (maps, terms)
+    rho, theta : array_like
+        Pupil coordinates (see zernike_basis)
+    ordering : str (optional)
+        Index ordering of the coefficients.  Default is 'osa'
+    indices : array_like (optional)
+        Index of each coefficient.  Default is consecutive indices from the
+        first index of the ordering
+    normalize : bool (optional)
+        Term normalization, see zernike_basis
+
+    Returns
+    -------
+    surface : ndarray
+        Shape (maps...,) + rho.shape
+    """
+
+    coefficients = np.asarray(coefficients, dtype=float)
+    if indices is None:
+        first = 0 if ordering.lower() in ('osa', 'ansi') else 1
+        indices = np.arange(first, first + coefficients.shape[-1])
+    basis = zernike_basis(indices, rho, theta, ordering,
+                          normalize=normalize)
+
+    return (coefficients @ basis).reshape(coefficients.shape[:-1]
+                                          + np.shape(rho))
+
+
+def zernike_label(j, ordering='osa'):
+    """Plot label of a term: the named labels for the first 15 OSA modes,
+    otherwise Z^m_n."""
+
+    n, m = index_to_nm(j, ordering)
+    osa = int(nm_to_osa(n[0], m[0]))
+    if osa < len(Z_labels):
+        return Z_labels[osa]
+    return r'$Z^{{{}}}_{{{}}}$'.format(m[0], n[0])
+
+
+def plot_zernikes(osa_index):
+    """ 3D plot of any zernike term (OSA/ANSI index)
+    """
+    
+    from plotting import plot_zernike
+    plot_zernike(osa_index)
 
 
-#plot each one.
-for i in np.arange(0,15):
-    plot_zernikes(i)
+if __name__ == '__main__':
+    #plot each one.
+    for i in np.arange(0,15):
+        plot_zernikes(i)
     
     
     
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Least-squares Zernike fitting of wavefront maps.
+
+For a pupil sampling (and mask), the Zernike basis B (terms, points) is
+factored once as B.T = QR.  Every map w is then fitted with one matrix
+product, q = w Q, and a small triangular solve, R c = q.  Since Q has
+orthonormal columns, the residual norm needs no second pass over the maps:
+
+    |w - c B|**2 = |w|**2 - |q|**2
+
+Factorizations are cached keyed on the terms, sampling grid and mask, so
+fitting thousands of maps from the same instrument reuses one QR.  Maps stored
+in a .npy file can be streamed through in chunks without loading the whole
+file.
+
+"""
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+from zernike import _grid_key, rms_normalized, zernike_basis
+
+
+class ZernikeFitter:
+    """ Cached least-squares fit of Zernike terms over one pupil sampling.
+
+    Parameters
+    ----------
+    indices : array_like
+        Term indices in the given ordering
+    rho, theta : array_like
+        Normalized pupil radius and azimuth of the map samples, any (matching)
+        shape, ex: a square grid
+    mask : array_like (optional)
+        True for valid samples, same shape as rho.  Points outside the unit
+        pupil are always excluded
+    obscuration : float (optional)
+        Central obscuration as a fraction of the pupil radius; samples with
+        rho < obscuration are excluded.  Default is 0
+    ordering : str (optional)
+        'osa' (default), 'noll' or 'fringe'
+    normalize : bool (optional)
+        Term normalization, see zernike.zernike_basis.  Default is the
+        convention of the ordering (peak normalized for 'fringe', so fitted
+        coefficients match interferometer Fringe coefficients)
+    """
+
+    def __init__(self, indices, rho, theta, mask=None, obscuration=0.0,
+                 ordering='osa', normalize=None):
+        rho = np.asarray(rho, dtype=float)
+        theta = np.broadcast_to(np.asarray(theta, dtype=float), rho.shape)
+        valid = (rho <= 1) & (rho >= obscuration)
+        if mask is not None:
+            valid &= np.asarray(mask, dtype=bool)
+
+        self.shape = rho.shape
+        self.valid = valid.ravel()
+        self.indices = np.atleast_1d(np.asarray(indices, dtype=int))
+        self.ordering = ordering
+        self.normalize = rms_normalized(ordering, normalize)
+
+        basis = zernike_basis(self.indices, rho.ravel()[self.valid],
+                              theta.ravel()[self.valid], ordering,
+                              cache=False, normalize=self.normalize)
+        if basis.shape[1] < basis.shape[0]:
+            raise ValueError('{} valid samples cannot fit {} terms'.format(
+                basis.shape[1], basis.shape[0]))
+
+        self.Q, self.R = np.linalg.qr(basis.T)
+        if np.any(np.abs(np.diag(self.R)) < 1e-10*np.abs(self.R).max()):
+            raise np.linalg.LinAlgError('terms are not independent over '
+                                        'this pupil sampling')
+        self.basis = basis
+
+
+    @property
+    def num_points(self):
+        """Number of valid samples."""
+        return self.Q.shape[0]
+
+
+    def _valid_points(self, maps):
+        """Maps as (maps, valid points), from either full grids (any shape
+        ending in the grid shape, or flattened) or valid samples only."""
+
+        maps = np.asarray(maps)
+        full = self.valid.size
+        if maps.shape[-len(self.shape):] == self.shape and self.shape != ():
+            maps = maps.reshape(-1, full)
+        else:
+            maps = maps.reshape(-1, maps.shape[-1])
+
+        if maps.shape[1] == full and full != self.num_points:
+            maps = maps[:,self.valid]
+        elif maps.shape[1] != self.num_points:
+            raise ValueError('maps have {} points, expected {} or {}'.format(
+                maps.shape[1], full, self.num_points))
+
+        return maps
+
+
+    def fit(self, maps):
+        """Fit a batch of wavefront maps.
+
+        Parameters
+        ----------
+        maps : array_like
+            Shape (maps, points) or (maps,) + grid shape; points are either
+            every grid sample or only the valid ones
+
+        Returns
+        -------
+        coefficients : ndarray
+            Shape (maps, terms)
+        rms : ndarray
+            RMS of the fit residual over the valid samples, shape (maps,)
+        """
+
+        w = self._valid_points(maps).astype(float, copy=False)
+        q = w @ self.Q
+        coefficients = np.linalg.solve(self.R, q.T).T
+
+        resid2 = np.einsum('ij,ij->i', w, w) - np.einsum('ij,ij->i', q, q)
+        rms = np.sqrt(np.maximum(resid2, 0)/self.num_points)
+
+        return coefficients, rms
+
+
+    def residual(self, maps):
+        """Fit residual of each map at the valid samples, shape (maps,
+        points)."""
+
+        w = self._valid_points(maps).astype(float, copy=False)
+        return w - (w @ self.Q) @ self.Q.T
+
+
+    def fit_stream(self, maps, chunk_size=1024):
+        """Fit maps chunk by chunk, yielding (coefficients, rms) for each
+        chunk.  maps is an array (ex: a memory-mapped .npy) or the path of a
+        .npy file, which is memory-mapped so only one chunk is read at a
+        time."""
+
+        if isinstance(maps, str):
+            maps = np.load(maps, mmap_mode='r')
+
+        for start in range(0, maps.shape[0], chunk_size):
+            yield self.fit(maps[start:start + chunk_size])
+
+
+    def fit_file(self, path, chunk_size=1024, out_path=None):
+        """Fit every map of a .npy file with fit_stream.
+
+        Parameters
+        ----------
+        path : str
+            .npy file of maps, shape (maps, points) or (maps,) + grid shape
+        chunk_size : int (optional)
+            Maps read and fitted at once.  Default is 1024
+        out_path : str (optional)
+            If given, coefficients are written to a memory-mapped .npy file
+            of shape (maps, terms) instead of being kept in memory
+
+        Returns
+        -------
+        coefficients : ndarray
+            Shape (maps, terms)
+        rms : ndarray
+            Shape (maps,)
+        """
+
+        maps = np.load(path, mmap_mode='r')
+        total = maps.shape[0]
+        shape = (total, self.indices.size)
+        if out_path is None:
+            coefficients = np.empty(shape)
+        else:
+            coefficients = np.lib.format.open_memmap(out_path, mode='w+',
+                                                     dtype=float, shape=shape)
+        rms = np.empty(total)
+
+        start = 0
+        for c, r in self.fit_stream(maps, chunk_size):
+            coefficients[start:start + c.shape[0]] = c
+            rms[start:start + c.shape[0]] = r
+            start += c.shape[0]
+
+        if out_path is not None:
+            coefficients.flush()
+
+        return coefficients, rms
+
+
+_FITTER_CACHE = OrderedDict()
+FITTER_CACHE_SIZE = 8
+
+
+def zernike_fitter(indices, rho, theta, mask=None, obscuration=0.0,
+                   ordering='osa', normalize=None):
+    """ZernikeFitter for a pupil sampling, reusing a cached factorization
+    when the terms, grid and mask match an earlier call."""
+
+    indices = np.atleast_1d(np.asarray(indices, dtype=int))
+    rho = np.asarray(rho, dtype=float)
+    theta = np.broadcast_to(np.asarray(theta, dtype=float), rho.shape)
+    mask_key = b'' if mask is None else _grid_key(np.asarray(mask, dtype=bool))
+    key = (ordering.lower(), rms_normalized(ordering, normalize),
+           indices.tobytes(), float(obscuration),
+           _grid_key(rho, theta), hashlib.sha1(mask_key).digest())
+
+    fitter = _FITTER_CACHE.get(key)
+    if fitter is None:
+        fitter = ZernikeFitter(indices, rho, theta, mask, obscuration,
+                               ordering, normalize)
+        _FITTER_CACHE[key] = fitter
+        if len(_FITTER_CACHE) > FITTER_CACHE_SIZE:
+            _FITTER_CACHE.popitem(last=False)
+    else:
+        _FITTER_CACHE.move_to_end(key)
+
+    return fitter
+
+
+def fit_zernikes(maps, indices, rho, theta, mask=None, obscuration=0.0,
+                 ordering='osa', normalize=None):
+    """Fit Zernike coefficients to a batch of maps (see ZernikeFitter.fit),
+    with the factorization cached per sampling.  Returns (coefficients,
+    rms)."""
+
+    fitter = zernike_fitter(indices, rho, theta, mask, obscuration, ordering,
+                            normalize)
+    return fitter.fit(maps)